@@ -1,83 +1,72 @@
-import pandas as pd
+import argparse
+import logging
 import os
+import sys
+import time
 
-def formatear_dialogo(dialogo, tab_size=4, acumulado=False):
-    """
-    Formatea el diálogo. Si es acumulado, no se añaden '<<', solo se concatenan las líneas con un espacio.
-    """
-    dialogo = str(dialogo).replace("“", '"').replace("”", '"')  # Reemplaza comillas tipográficas por comillas rectas
-    if acumulado:
-        return dialogo.replace("\n", " ")  # Reemplaza saltos de línea por espacios
-    else:
-        lineas = dialogo.split("\n")
-        tab = " " * tab_size
-        if len(lineas) == 1:
-            return lineas[0]
-        else:
-            return lineas[0] + "\n" + "\n".join([f"{tab}<< {linea}" for linea in lineas[1:]])
+from Takeo import FORMATOS_TABLA, buscar_archivos, formatear_dialogo, mapear_en_procesos, transformar_excel_a_txt  # noqa: F401 (API histórica de este módulo)
 
-def transformar_excel_a_txt(ruta_excel, ruta_salida_txt):
-    # Obtener el nombre del archivo sin la extensión y en mayúsculas
-    nombre_archivo = os.path.splitext(os.path.basename(ruta_excel))[0].upper()
+# Convierte a TXT de diálogos los takes ya exportados (_TAKEO.xlsx, .csv, .parquet...), por ejemplo
+# después de retocarlos a mano. Importar el módulo no tiene efectos; la conversión en
+# bloque está en main():
+#   python Excel_to_Dialog.py temporada2/ --salida dialogos/ --workers 4
 
-    # Leer datos del Excel
-    df = pd.read_excel(ruta_excel)
-    
-    # Asegurarnos de que las columnas necesarias existen
-    columnas_necesarias = ["TAKE", "IN", "OUT", "PERSONAJE", "DIÁLOGO", "DURACIÓN", "SCENE"]
-    for col in columnas_necesarias:
-        if col not in df.columns:
-            raise ValueError(f"Falta la columna requerida: {col}")
+SUFIJO_TAKEO = '_TAKEO'
 
-    # Convertir todo en texto para prevenir problemas con valores no string
-    df["DIÁLOGO"] = df["DIÁLOGO"].astype(str)
+# 1. Buscar los archivos de takes en directorios o patrones glob
+def es_takeo(ruta):
+    nombre = os.path.basename(ruta)
+    # Ignorar archivos temporales de Excel
+    return not nombre.startswith('~$') and nombre.lower().endswith(tuple(FORMATOS_TABLA))
 
-    # Reemplazar ":" por " " en IN y OUT
-    df["IN"] = df["IN"].str.replace(":", " ", regex=False)
-    df["OUT"] = df["OUT"].str.replace(":", " ", regex=False)
+def buscar_takeos(entradas):
+    return buscar_archivos(entradas, es_takeo, f'*{SUFIJO_TAKEO}.*')
 
-    # Agrupar por TAKE
-    agrupado_por_take = df.groupby("TAKE")
-    
-    with open(ruta_salida_txt, "w", encoding="utf-8") as archivo_salida:
-        # Escribir el nombre del archivo al principio
-        archivo_salida.write(f"{nombre_archivo}\n\n")
-        
-        for take, grupo in agrupado_por_take:
-            archivo_salida.write(f"TAKE {take}\n")
-            archivo_salida.write(f"{grupo.iloc[0]['IN']}\n")  # TC de IN
-            
-            dialogo_actual = ""  # Para acumular el diálogo combinado
-            personaje_actual = None
-            
-            for idx, fila in grupo.iterrows():
-                personaje = fila["PERSONAJE"]
-                dialogo = formatear_dialogo(fila["DIÁLOGO"], acumulado=True)
+def ruta_dialogo(ruta_excel, directorio_salida=None):
+    # X_TAKEO.xlsx -> X_DIALOG.txt, el mismo nombre que genera Takeo
+    base = os.path.splitext(os.path.basename(ruta_excel))[0]
+    if base.upper().endswith(SUFIJO_TAKEO):
+        base = base[:-len(SUFIJO_TAKEO)]
+    return os.path.join(directorio_salida or os.path.dirname(ruta_excel), f"{base}_DIALOG.txt")
 
-                # Si el personaje actual es el mismo, acumular diálogo con espacio
-                if personaje == personaje_actual:
-                    dialogo_actual += f" {dialogo}"  # Concatenar con un espacio
-                else:
-                    # Si hay un personaje previo, escribir su diálogo acumulado
-                    if personaje_actual:
-                        archivo_salida.write(f"{personaje_actual}:\t{dialogo_actual}\n")
-                    
-                    # Cambiar al nuevo personaje y reiniciar diálogo acumulado
-                    personaje_actual = personaje
-                    dialogo_actual = dialogo
+# 2. Convertir un archivo (nunca lanza excepciones, para usarse dentro del pool)
+def convertir_archivo(ruta_excel, directorio_salida=None):
+    inicio = time.perf_counter()
+    ruta_salida_txt = ruta_dialogo(ruta_excel, directorio_salida)
+    try:
+        transformar_excel_a_txt(ruta_excel, ruta_salida_txt)
+        resultado = {'archivo': ruta_excel, 'txt': ruta_salida_txt, 'estado': 'ok'}
+    except Exception as e:
+        logging.error(f"Error al convertir '{ruta_excel}': {e}")
+        resultado = {'archivo': ruta_excel, 'estado': 'error', 'error': f"{type(e).__name__}: {e}"}
+    resultado['segundos'] = round(time.perf_counter() - inicio, 3)
+    return resultado
 
-            # Escribir el último diálogo acumulado del TAKE
-            if personaje_actual:
-                archivo_salida.write(f"{personaje_actual}:\t{dialogo_actual}\n")
-            
-            # Escribir el OUT del último diálogo del TAKE
-            archivo_salida.write(f"{grupo.iloc[-1]['OUT']}\n\n")
-    
-    print(f"Archivo de texto generado en: {ruta_salida_txt}")
+# 3. Convertir todos los archivos con un pool de procesos
+def convertir_lote(archivos, directorio_salida=None, num_workers=None):
+    return mapear_en_procesos(convertir_archivo, archivos, directorio_salida, num_workers=num_workers)
 
-# Ruta al archivo Excel y al archivo de salida
-ruta_excel = "prop_optimizada.xlsx"
-ruta_salida_txt = "salida_formateada.txt"
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Generar los TXT de diálogos de archivos de takes ya exportados.")
+    parser.add_argument('entradas', nargs='+', help="Archivos de takes, directorios (se buscan *_TAKEO.xlsx, .csv, .parquet...) o patrones glob.")
+    parser.add_argument('--salida', dest='directorio_salida', default=None, help="Directorio de salida (por defecto, junto a cada Excel).")
+    parser.add_argument('--workers', type=int, default=None, help="Archivos convertidos a la vez (por defecto, todos los núcleos).")
+    return parser
 
-# Llamar a la función
-transformar_excel_a_txt(ruta_excel, ruta_salida_txt)
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    archivos = buscar_takeos(args.entradas)
+    if not archivos:
+        logging.error("No se encontraron archivos de takes para convertir.")
+        return 1
+    if args.directorio_salida:
+        os.makedirs(args.directorio_salida, exist_ok=True)
+
+    inicio = time.perf_counter()
+    resultados = convertir_lote(archivos, args.directorio_salida, args.workers)
+    errores = sum(1 for r in resultados if r['estado'] != 'ok')
+    logging.info(f"{len(resultados) - errores}/{len(resultados)} archivos convertidos en {time.perf_counter() - inicio:.2f} s")
+    return 1 if errores else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,76 @@
-import pandas as pd
-from datetime import timedelta
+import time
+INICIO_ARRANQUE = time.perf_counter()
+
+import importlib
+import importlib.util
+import sys
+from fractions import Fraction
 import re
 import warnings
 import unicodedata
 import functools
-from itertools import groupby
+import itertools
+import math
+from array import array
 from operator import itemgetter
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+import multiprocessing
 import logging
 import os
+import json
+import contextlib
+import tracemalloc
+import glob
+import hashlib
+import inspect
+import sqlite3
+
+# Importación diferida de pandas y numpy: el módulo se ejecuta al acceder a su primer
+# atributo. Así la ventana principal aparece sin esperar a estas importaciones, que se
+# completan en segundo plano (precargar_dependencias) mientras el usuario elige archivo.
+def importar_diferido(nombre):
+    if nombre in sys.modules:
+        return sys.modules[nombre]
+    spec = importlib.util.find_spec(nombre)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nombre] = modulo
+    loader.exec_module(modulo)
+    return modulo
+
+pd = importar_diferido('pandas')
+np = importar_diferido('numpy')
+
+# Módulos que se cargan antes de leer el primer guion; los motores de Excel los importa
+# pandas por su cuenta al leer y exportar
+DEPENDENCIAS_PESADAS = ('numpy', 'pandas', 'openpyxl', 'xlsxwriter')
+_lock_dependencias = threading.Lock()
+tiempos_arranque = {}
+
+def cargar_dependencias():
+    # Fuerza la carga completa de las dependencias pesadas. El lock evita que dos hilos
+    # ejecuten a la vez un módulo diferido (LazyLoader no es seguro entre hilos).
+    with _lock_dependencias:
+        if 'dependencias' in tiempos_arranque:
+            return
+        for nombre in DEPENDENCIAS_PESADAS:
+            try:
+                modulo = importlib.import_module(nombre)
+                getattr(modulo, '__version__', None)  # Ejecuta el módulo si aún es diferido
+            except ImportError as e:
+                logging.warning(f"No se pudo precargar '{nombre}': {e}")
+        tiempos_arranque['dependencias'] = round(time.perf_counter() - INICIO_ARRANQUE, 4)
+
+def precargar_dependencias(al_terminar=None):
+    def precargar():
+        cargar_dependencias()
+        if al_terminar is not None:
+            al_terminar()
+    threading.Thread(target=precargar, daemon=True).start()
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -18,253 +78,1013 @@ logging.basicConfig(level=logging.INFO)
 # Ignorar advertencias de futuras versiones
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
-# 1. Función para convertir tiempo a timedelta
-@functools.lru_cache(maxsize=None)
-def time_to_timedelta(time_str):
-    try:
-        parts = time_str.split(':')
-        if len(parts) == 4:
-            hours, minutes, seconds, frames = map(int, parts)
-        elif len(parts) == 3:
-            hours, minutes, seconds = map(int, parts)
-            frames = 0
-        else:
-            raise ValueError("Formato de tiempo incorrecto")
-        total_seconds = hours * 3600 + minutes * 60 + seconds + frames / 24
-        return timedelta(seconds=total_seconds)
-    except Exception as e:
-        logging.error(f"Error al convertir tiempo: {time_str} - {e}")
-        return timedelta(0)
+# Procesos usados para optimizar escenas en paralelo (None = todos los núcleos)
+NUM_WORKERS = None
+# Líneas a optimizar a partir de las cuales se usa el pool: por debajo, arrancar los procesos
+# (spawn en Windows, alrededor de 1 s) cuesta más que optimizar aquí, a unas 500.000 líneas/s
+MIN_LINEAS_PROCESOS = 500_000
+
+# Caché en disco de escenas ya optimizadas (None = sin caché) y su tamaño máximo
+USAR_CACHE_ESCENAS = True
+MAX_BYTES_CACHE_ESCENAS = 64 * 2**20
+
+# Espera tras el último cambio de selección antes de recalcular la previsualización de takes
+RETARDO_PREVISUALIZACION_MS = 300
+
+# Ventana de personajes: espera tras la última tecla antes de filtrar y filas (casillas) visibles
+RETARDO_BUSQUEDA_MS = 150
+FILAS_LISTA_PERSONAJES = 12
+
+# JSON de métricas, cachés y registros: los valores de NumPy (p. ej. el número de escena)
+# se guardan como números de Python
+def valor_json(valor):
+    return valor.item() if isinstance(valor, np.generic) else str(valor)
+
+def guardar_json_atomico(ruta, datos, **opciones):
+    # Escribir en un temporal y renombrar, para no dejar el JSON a medias
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(datos, archivo, ensure_ascii=False, default=valor_json, **opciones)
+    os.replace(temporal, ruta)
+
+# Procesos por lotes (takeo_cli y Excel_to_Dialog): búsqueda de archivos y pool de procesos
+def buscar_archivos(entradas, aceptar, patron='*'):
+    # entradas: archivos, directorios (se buscan los que cumplen patron) o patrones glob
+    archivos = []
+    for entrada in entradas:
+        candidatos = glob.glob(os.path.join(entrada, patron) if os.path.isdir(entrada) else entrada)
+        archivos.extend(os.path.abspath(ruta) for ruta in candidatos if os.path.isfile(ruta) and aceptar(ruta))
+    return sorted(set(archivos))
+
+def mapear_en_procesos(funcion, elementos, *argumentos, num_workers=None, al_terminar=None):
+    # funcion(elemento, *argumentos) no debe lanzar excepciones; al_terminar(elemento, resultado, hechos)
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_workers = max(1, min(num_workers, len(elementos)))
+
+    resultados = {}
+    if num_workers == 1:
+        for elemento in elementos:
+            resultados[elemento] = funcion(elemento, *argumentos)
+            if al_terminar:
+                al_terminar(elemento, resultados[elemento], len(resultados))
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futuros = {executor.submit(funcion, elemento, *argumentos): elemento for elemento in elementos}
+            for futuro in as_completed(futuros):
+                elemento = futuros[futuro]
+                resultados[elemento] = futuro.result()
+                if al_terminar:
+                    al_terminar(elemento, resultados[elemento], len(resultados))
+
+    # Devolver los resultados en el orden de los elementos, no en el de finalización
+    return [resultados[elemento] for elemento in elementos]
+
+# Métricas de ejecución: tiempo y filas por etapa, estadísticas del optimizador por escena
+# y aciertos de las cachés. Se muestran en la GUI y se guardan junto al _TAKEO.xlsx.
+class Metricas:
+    def __init__(self):
+        self.etapas = {}
+        self.escenas = []
+        self.caches = {}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def etapa(self, nombre):
+        # Mide el bloque 'with'; el llamador puede anotar datos['filas'] y datos['bytes_df']
+        # (memoria del DataFrame resultante, ver memoria_df). Si tracemalloc está activo
+        # (benchmarks) también se anota el pico de memoria.
+        datos = {'filas': None, 'bytes_df': None}
+        medir_memoria = tracemalloc.is_tracing()
+        if medir_memoria:
+            tracemalloc.reset_peak()
+            memoria_inicial = tracemalloc.get_traced_memory()[0]
+        inicio = time.perf_counter()
+        try:
+            yield datos
+        finally:
+            self.registrar_etapa(nombre, time.perf_counter() - inicio, datos['filas'], datos['bytes_df'])
+            if medir_memoria:
+                self.etapas[nombre]['pico_bytes'] = tracemalloc.get_traced_memory()[1] - memoria_inicial
+
+    def registrar_etapa(self, nombre, segundos, filas=None, bytes_df=None):
+        datos = {'segundos': round(segundos, 6), 'filas': filas}
+        mensaje = f"Etapa '{nombre}': {segundos:.3f} s"
+        if filas is not None:
+            mensaje += f", {filas} filas"
+            if segundos > 0:
+                datos['filas_por_segundo'] = round(filas / segundos)
+                mensaje += f" ({datos['filas_por_segundo']} filas/s)"
+        if bytes_df is not None:
+            datos['bytes_df'] = bytes_df
+            mensaje += f", {bytes_df / 2**20:.1f} MB"
+        with self.lock:
+            self.etapas[nombre] = datos
+        logging.info(mensaje)
+
+    def contar_cache(self, nombre, aciertos, fallos):
+        with self.lock:
+            cache = self.caches.setdefault(nombre, {'aciertos': 0, 'fallos': 0})
+            cache['aciertos'] += aciertos
+            cache['fallos'] += fallos
+
+    def resumen_optimizador(self):
+        # Coste total (suma de takes por personaje) frente a la suma de cotas inferiores
+        coste = sum(e['coste'] for e in self.escenas if e.get('coste') is not None)
+        cota = sum(e['cota_inferior'] for e in self.escenas if e.get('coste') is not None)
+        return {
+            'coste_total': coste,
+            'cota_inferior_total': cota,
+            'brecha': round((coste - cota) / cota, 4) if cota else None,
+            'escenas_aproximadas': [e['escena'] for e in self.escenas if e.get('motor') == 'voraz'],
+        }
+
+    def etapa_mas_pesada(self):
+        # (nombre, bytes) de la etapa cuyo DataFrame ocupa más memoria, o None
+        medidas = [(nombre, datos['bytes_df']) for nombre, datos in self.etapas.items() if datos.get('bytes_df') is not None]
+        return max(medidas, key=itemgetter(1)) if medidas else None
+
+    def escenas_mas_lentas(self, cantidad=5):
+        return sorted(self.escenas, key=lambda e: e['segundos'], reverse=True)[:cantidad]
+
+    def a_dict(self):
+        caches = {}
+        for nombre, cache in self.caches.items():
+            total = cache['aciertos'] + cache['fallos']
+            caches[nombre] = {**cache, 'tasa_aciertos': round(cache['aciertos'] / total, 4) if total else None}
+        return {
+            'total_segundos': round(sum(e['segundos'] for e in self.etapas.values()), 6),
+            'max_bytes_df': max((e['bytes_df'] for e in self.etapas.values() if e.get('bytes_df') is not None), default=None),
+            'etapas': self.etapas,
+            'optimizador': self.resumen_optimizador(),
+            'escenas_mas_lentas': self.escenas_mas_lentas(),
+            'escenas': self.escenas,
+            'caches': caches,
+        }
+
+    def guardar_json(self, ruta):
+        guardar_json_atomico(ruta, self.a_dict(), indent=2)
+
+    def resumen_texto(self):
+        # Texto corto para la etiqueta de estado de la GUI
+        partes = [f"Total: {sum(e['segundos'] for e in self.etapas.values()):.2f} s"]
+        if 'optimizacion' in self.etapas:
+            partes.append(f"optimización: {self.etapas['optimizacion']['segundos']:.2f} s")
+        lentas = self.escenas_mas_lentas(1)
+        if lentas:
+            partes.append(f"escena más lenta: {lentas[0]['escena']} ({lentas[0]['segundos']:.2f} s, {lentas[0]['bloques']} bloques)")
+        aproximadas = self.resumen_optimizador()['escenas_aproximadas']
+        if aproximadas:
+            partes.append(f"{len(aproximadas)} escenas con motor aproximado")
+        pesada = self.etapa_mas_pesada()
+        if pesada:
+            partes.append(f"memoria máx.: {pesada[1] / 2**20:.1f} MB ({pesada[0]})")
+        excel = self.etapas.get('exportar_excel')
+        if excel and excel.get('filas_por_segundo'):
+            partes.append(f"Excel: {excel['filas']} filas ({excel['filas_por_segundo']} filas/s)")
+        return " | ".join(partes)
+
+# 1. Convertir códigos de tiempo a número entero de frames
+# Frecuencia -> (frames por segundo del código de tiempo, frames reales por segundo, drop-frame)
+FRECUENCIAS = {
+    '23.976': (24, Fraction(24000, 1001), False),
+    '24': (24, Fraction(24), False),
+    '25': (25, Fraction(25), False),
+    '29.97': (30, Fraction(30000, 1001), False),
+    '29.97DF': (30, Fraction(30000, 1001), True),
+    '30': (30, Fraction(30), False),
+}
+
+# Frecuencia usada por defecto en los guiones
+FRAME_RATE = '24'
+
+# HH:MM:SS:FF (o HH:MM:SS;FF en drop-frame) u HH:MM:SS sin frames
+PATRON_TIMECODE = r'^\s*(\d+):(\d+):(\d+)(?:[:;](\d+))?\s*$'
+
+def fps_real(frame_rate=FRAME_RATE):
+    return FRECUENCIAS[frame_rate][1]
+
+def timecodes_a_frames(timecodes, frame_rate=FRAME_RATE):
+    # Convierte una columna entera de códigos de tiempo en un array int64 de frames.
+    # Los valores mal formados cuentan como 0 y se registran todos juntos en un solo mensaje.
+    timecodes = pd.Series(timecodes)
+    if isinstance(timecodes.dtype, pd.CategoricalDtype):
+        # Cada código de tiempo distinto se convierte una sola vez (los vacíos, código -1, son inválidos)
+        frames_categorias, invalidas = frames_y_invalidos(pd.Series(timecodes.cat.categories), frame_rate)
+        codigos = timecodes.cat.codes.to_numpy()
+        vacios = codigos < 0
+        total = np.where(vacios, 0, frames_categorias[codigos])
+        invalidos = vacios | invalidas[codigos]
+    else:
+        total, invalidos = frames_y_invalidos(timecodes, frame_rate)
+
+    if invalidos.any():
+        ejemplos = ', '.join(repr(t) for t in timecodes[invalidos].head(5))
+        logging.error(f"Error al convertir tiempo: {invalidos.sum()} valores con formato incorrecto (p. ej. {ejemplos}); se toman como 0")
+    return total
+
+def frames_y_invalidos(timecodes, frame_rate=FRAME_RATE):
+    frames_por_segundo, _, drop_frame = FRECUENCIAS[frame_rate]
+    partes = timecodes.astype(str).str.extract(PATRON_TIMECODE)
+    invalidos = partes[0].isna().to_numpy()
+    horas, minutos, segundos, frames = partes.fillna(0).astype(np.int64).to_numpy().T
+
+    total = (horas * 3600 + minutos * 60 + segundos) * frames_por_segundo + frames
+    if drop_frame:
+        # Se saltan 2 números de frame por minuto, salvo en los minutos múltiplos de 10
+        total_minutos = horas * 60 + minutos
+        total -= (frames_por_segundo // 15) * (total_minutos - total_minutos // 10)
+    total[invalidos] = 0
+    return total, invalidos
 
 # 2. Dividir diálogos que excedan los 60 caracteres (excluyendo contenido entre paréntesis)
 def dividir_dialogo(dialogo, max_caracteres=60):
+    if not isinstance(dialogo, str):
+        return [dialogo]
     dialogo_sin_parentesis = re.sub(r'\(.*?\)', '', dialogo)
     if len(dialogo_sin_parentesis) <= max_caracteres:
         return [dialogo]
 
+    # La longitud sin paréntesis de la línea en curso se calcula de forma incremental:
+    # visibles = caracteres fuera de paréntesis; pendientes = caracteres desde un '('
+    # aún sin cerrar, que solo desaparecen si más adelante llega un ')'
+    def avanzar(estado, texto):
+        visibles, pendientes, abierto = estado
+        for ch in texto:
+            if abierto:
+                pendientes += 1
+                if ch == ')':
+                    pendientes = 0
+                    abierto = False
+            elif ch == '(':
+                pendientes = 1
+                abierto = True
+            else:
+                visibles += 1
+        return visibles, pendientes, abierto
+
     palabras = dialogo.split()
     lineas = []
     linea_actual = ''
+    estado_actual = (0, 0, False)
     for palabra in palabras:
-        temp = f"{linea_actual} {palabra}".strip()
-        temp_sin_parentesis = re.sub(r'\(.*?\)', '', temp)
-        if len(temp_sin_parentesis) > max_caracteres:
+        if linea_actual:
+            estado_temp = avanzar(estado_actual, f" {palabra}")
+        else:
+            estado_temp = avanzar(estado_actual, palabra)
+        if estado_temp[0] + estado_temp[1] > max_caracteres:
             if linea_actual:
                 lineas.append(linea_actual)
             linea_actual = palabra
+            estado_actual = avanzar((0, 0, False), palabra)
         else:
-            linea_actual = temp
+            linea_actual = f"{linea_actual} {palabra}" if linea_actual else palabra
+            estado_actual = estado_temp
     if linea_actual:
         lineas.append(linea_actual)
     return lineas
 
-# 3. Expandir diálogos
-def expandir_dialogos(df_original):
-    nuevas_filas = []
-    for idx, row in df_original.iterrows():
-        lineas_divididas = dividir_dialogo(row['DIÁLOGO'])
-        for linea in lineas_divididas:
-            new_row = row.copy()
-            new_row['DIÁLOGO'] = linea
-            nuevas_filas.append(new_row)
-    return pd.DataFrame(nuevas_filas)
+# 3. Expandir diálogos: una fila por cada línea dividida
+def expandir_dialogos(df_original, max_caracteres=60):
+    lineas_divididas = pd.Series([dividir_dialogo(d, max_caracteres) for d in df_original['DIÁLOGO']],
+                                 index=df_original.index, dtype=object)
+    # Los diálogos que no producen ninguna línea desaparecen
+    con_lineas = lineas_divididas.str.len() > 0
+    df = df_original[con_lineas].assign(**{'DIÁLOGO': lineas_divididas[con_lineas]})
+    return df.explode('DIÁLOGO')
 
 # 4. Limpiar columnas de texto
+class TablaControl(dict):
+    # Tabla para str.translate que elimina los caracteres de categoría Unicode 'C'
+    # (control, formato, etc.). Cada carácter se clasifica una sola vez, la primera
+    # vez que aparece, así que la tabla solo contiene los caracteres ya vistos.
+    def __missing__(self, codigo):
+        valor = None if unicodedata.category(chr(codigo))[0] == 'C' else codigo
+        self[codigo] = valor
+        return valor
+
+TABLA_CONTROL = TablaControl()
+
 def clean_text(text):
     if isinstance(text, str):
-        text = ''.join(ch for ch in text if unicodedata.category(ch)[0] != 'C')
-        return text
+        return text.translate(TABLA_CONTROL)
     else:
         return text
 
-# 5. Optimizar la división de *takes* en una escena considerando bloques con el mismo IN/OUT
-def optimizar_takes_escena(intervenciones_escena, max_duracion_take=30, max_lineas_take=10, max_lineas_consecutivas=5, max_lineas_por_personaje=5):
-    intervenciones = []
-    for idx, row in intervenciones_escena.iterrows():
-        intervenciones.append({
-            'idx': idx,
-            'in_td': row['in_td'],
-            'out_td': row['out_td'],
-            'duracion': row['duracion'],
-            'personaje': row['PERSONAJE'],
-            'dialogo': row['DIÁLOGO'],
-            'IN': row['IN'],
-            'OUT': row['OUT'],
-            'SCENE': row['SCENE']
-        })
+def limpiar_columna(serie, metricas=None):
+    # Limpieza de toda la columna a la vez; los valores que no son texto se conservan
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Se limpia cada valor distinto una sola vez; dos nombres que solo se diferencian
+        # en caracteres de control quedan en la misma categoría
+        categorias = pd.Series(serie.cat.categories)
+        limpias = limpiar_columna(categorias, metricas)
+        return serie.map(dict(zip(categorias, limpias))).astype('category')
+    caracteres_conocidos = len(TABLA_CONTROL)
+    limpia = serie.str.translate(TABLA_CONTROL)
+    if metricas is not None:
+        fallos = len(TABLA_CONTROL) - caracteres_conocidos
+        metricas.contar_cache('tabla_control', int(serie.str.len().sum()) - fallos, fallos)
+    return limpia.where(limpia.notna(), serie)
 
-    if not intervenciones:
+# 5. Optimizar la división de *takes* en una escena considerando bloques con el mismo IN/OUT
+class EscenaCompacta:
+    # Intervenciones de una escena en columnas compactas, ordenadas por (IN, OUT):
+    # personajes como enteros internos (0..num_personajes-1), frames en arrays int64
+    # y el inicio de cada bloque de igual IN/OUT (con un último valor centinela).
+    __slots__ = ('escena', 'filas', 'personajes', 'nombres', 'num_personajes', 'in_frames', 'out_frames', 'inicio_bloques')
+
+    def __init__(self, intervenciones_escena):
+        codigos, nombres = pd.factorize(intervenciones_escena['PERSONAJE'], use_na_sentinel=False)
+        self.iniciar(intervenciones_escena['SCENE'].iloc[0] if len(intervenciones_escena) else None,
+                     intervenciones_escena.index.to_numpy(), codigos, [str(p) for p in nombres],
+                     intervenciones_escena['in_frames'].to_numpy(dtype=np.int64),
+                     intervenciones_escena['out_frames'].to_numpy(dtype=np.int64))
+
+    @classmethod
+    def desde_columnas(cls, escena, filas, personajes, nombres, in_frames, out_frames):
+        # Igual que EscenaCompacta(df_escena), a partir de columnas ya convertidas a arrays
+        # (personajes como códigos enteros de la lista nombres, compartida por todo el guion)
+        nueva = cls.__new__(cls)
+        nueva.iniciar(escena, filas, personajes, nombres, in_frames, out_frames)
+        return nueva
+
+    def iniciar(self, escena, filas, personajes, nombres, in_frames, out_frames):
+        orden = np.lexsort((out_frames, in_frames))  # estable, como sorted()
+        self.escena = escena
+        self.filas = filas[orden]
+        codigos, unicos = pd.factorize(personajes[orden])
+        self.personajes = array('i', codigos)
+        self.nombres = [nombres[c] for c in unicos]
+        self.num_personajes = len(unicos)
+        self.in_frames = in_frames[orden]
+        self.out_frames = out_frames[orden]
+
+        cambios = np.flatnonzero((np.diff(self.in_frames) != 0) | (np.diff(self.out_frames) != 0)) + 1
+        self.inicio_bloques = array('q', [0, *cambios.tolist(), len(orden)] if len(orden) else [0])
+
+    def __len__(self):
+        return len(self.personajes)
+
+# Motores del optimizador: 'exacto' (programación dinámica), 'voraz' (cada take se alarga
+# todo lo posible) o 'auto' (exacto salvo que la escena supere limite_bloques o limite_segundos)
+MOTORES = ('auto', 'exacto', 'voraz')
+
+def cota_inferior_takes(escena, max_frames_take, max_lineas_take=10, max_lineas_por_personaje=5):
+    # Ningún reparto puede bajar de esta suma. Las líneas de un personaje dentro de un take
+    # son consecutivas entre sus líneas, caben en max_frames_take y en max_lineas_take, y no
+    # pasan de max_lineas_por_personaje; para cada personaje se cuenta el mínimo de grupos
+    # así (agrupando de forma voraz, que es óptimo para este subproblema).
+    in_frames = escena.in_frames.tolist()
+    out_frames = escena.out_frames.tolist()
+    grupos = [0] * escena.num_personajes
+    inicio_grupo = [0] * escena.num_personajes  # índice de la primera línea del grupo abierto
+    lineas_grupo = [0] * escena.num_personajes
+    for i, personaje in enumerate(escena.personajes):
+        j = inicio_grupo[personaje]
+        if (lineas_grupo[personaje] == 0
+                or lineas_grupo[personaje] >= max_lineas_por_personaje
+                or out_frames[i] - in_frames[j] > max_frames_take
+                or i - j + 1 > max_lineas_take):
+            grupos[personaje] += 1
+            inicio_grupo[personaje] = i
+            lineas_grupo[personaje] = 0
+        lineas_grupo[personaje] += 1
+    return sum(grupos)
+
+def optimizar_takes_escena(intervenciones_escena, max_duracion_take=30, max_lineas_take=10, max_lineas_consecutivas=5, max_lineas_por_personaje=5, frame_rate=FRAME_RATE,
+                           motor='auto', limite_bloques=20000, limite_segundos=30, estadisticas=None):
+    # Acepta un DataFrame de la escena o una EscenaCompacta ya construida.
+    # Devuelve los takes como rangos [inicio, fin) de líneas en el orden de la escena compacta.
+    # Si se pasa el diccionario estadisticas, se rellena con los datos de la búsqueda.
+    escena = intervenciones_escena if isinstance(intervenciones_escena, EscenaCompacta) else EscenaCompacta(intervenciones_escena)
+    if not len(escena):
         return []
-
-    # Ordenar las intervenciones
-    intervenciones_sorted = sorted(intervenciones, key=lambda x: (x['in_td'], x['out_td']))
-
-    # Agrupar las intervenciones por (in_td, out_td) para formar bloques indivisibles
-    bloques = []
-    for key, group in groupby(intervenciones_sorted, key=lambda x: (x['in_td'], x['out_td'])):
-        bloque = list(group)
-        bloques.append(bloque)
-
-    n = len(bloques)
-
-    @functools.lru_cache(maxsize=None)
-    def dp(pos):
-        # dp devuelve (best_takes, best_cost)
-        # best_cost = suma total mínima de takes por personaje desde pos al final
-        if pos >= n:
-            return [], 0
-
-        best_takes = None
-        best_cost = float('inf')
-
-        # Intentar formar un take con uno o varios bloques consecutivos
-        take_intervenciones = []
-        take_in = None
-        take_out = None
-
-        personaje_lineas_totales_take = {}
-        personaje_lineas_consecutivas_take = {}
-        ultimo_personaje = None
-        lineas_count = 0
+    if motor not in MOTORES:
+        raise ValueError(f"Motor de optimización desconocido: {motor}")
+
+    # Duración máxima en frames: un take es demasiado largo si supera este número de frames
+    max_frames_take = math.floor(Fraction(max_duracion_take) * fps_real(frame_rate))
+
+    personajes = escena.personajes
+    inicio_bloques = escena.inicio_bloques
+    in_bloque = escena.in_frames[inicio_bloques[:-1]].tolist()
+    out_bloque = escena.out_frames[inicio_bloques[:-1]].tolist()
+    n = len(inicio_bloques) - 1
+
+    # Líneas por personaje en el take en curso; se reinicia solo en los personajes tocados
+    lineas_personaje = [0] * escena.num_personajes
+    contadores = {'extensiones': 0, 'candidatos': 0}
+
+    def finales_validos(pos):
+        # Lista de (fin, personajes_en_take) para cada take válido que empieza en el bloque pos
+        # y termina justo antes del bloque fin, de menor a mayor longitud
+        finales = []
+        take_in = in_bloque[pos]
+        tocados = []
+        personajes_en_take = 0
+        ultimo_personaje = -1
+        lineas_consecutivas = 0
 
         for end in range(pos, n):
-            bloque = bloques[end]
-            # Intentar añadir este bloque completo al take
+            contadores['extensiones'] += 1
+            # Intentar añadir este bloque completo al take; si no cabe no se
+            # puede seguir ampliando el take, así que se actualiza el estado directamente
             bloque_valido = True
-            bloque_lineas = 0
-            bloque_cambios = []
-            temp_personaje_lineas_totales = dict(personaje_lineas_totales_take)
-            temp_personaje_lineas_consecutivas = dict(personaje_lineas_consecutivas_take)
-            temp_ultimo_personaje = ultimo_personaje
-
-            for intervencion in bloque:
-                if take_in is None:
-                    take_in = intervencion['in_td']
-                take_out = intervencion['out_td']
-
-                personaje = intervencion['personaje']
-                bloque_lineas += 1
+            for i in range(inicio_bloques[end], inicio_bloques[end + 1]):
+                personaje = personajes[i]
 
                 # Actualizar líneas totales por personaje
-                temp_personaje_lineas_totales[personaje] = temp_personaje_lineas_totales.get(personaje, 0) + 1
-                if temp_personaje_lineas_totales[personaje] > max_lineas_por_personaje:
+                if lineas_personaje[personaje] == 0:
+                    tocados.append(personaje)
+                    personajes_en_take += 1
+                lineas_personaje[personaje] += 1
+                if lineas_personaje[personaje] > max_lineas_por_personaje:
                     bloque_valido = False
                     break
 
                 # Actualizar líneas consecutivas
-                if personaje != temp_ultimo_personaje:
-                    temp_personaje_lineas_consecutivas[personaje] = 1
+                if personaje != ultimo_personaje:
+                    lineas_consecutivas = 1
                 else:
-                    temp_personaje_lineas_consecutivas[personaje] = temp_personaje_lineas_consecutivas.get(personaje, 0) + 1
-
-                if temp_personaje_lineas_consecutivas[personaje] > max_lineas_consecutivas:
+                    lineas_consecutivas += 1
+                if lineas_consecutivas > max_lineas_consecutivas:
                     bloque_valido = False
                     break
 
-                temp_ultimo_personaje = personaje
+                ultimo_personaje = personaje
 
             if not bloque_valido:
                 # No podemos añadir este bloque, romper el intento de expandir el take
                 break
 
-            # Si el bloque es válido, lo añadimos realmente
-            for intervencion in bloque:
-                take_intervenciones.append(intervencion)
-            personaje_lineas_totales_take = temp_personaje_lineas_totales
-            personaje_lineas_consecutivas_take = temp_personaje_lineas_consecutivas
-            ultimo_personaje = temp_ultimo_personaje
-            lineas_count += bloque_lineas
-
             # Verificar duración y cantidad de líneas tras añadir este bloque
-            duracion_take = take_out - take_in
-            if duracion_take.total_seconds() > max_duracion_take:
+            if out_bloque[end] - take_in > max_frames_take:
                 break
 
-            if lineas_count > max_lineas_take:
+            if inicio_bloques[end + 1] - inicio_bloques[pos] > max_lineas_take:
                 break
 
-            # Si hemos llegado aquí, este take (pos -> end) es válido.
-            # Calcular el coste actual y decidir si cerramos el take aquí o intentamos añadir más bloques
-            personajes_en_take = set(i['personaje'] for i in take_intervenciones)
-            next_takes, next_cost = dp(end + 1)
-            current_cost = next_cost + len(personajes_en_take)
-
-            if current_cost < best_cost:
-                best_takes = [tuple(take_intervenciones)] + next_takes
-                best_cost = current_cost
-
-            # Intentar añadir el siguiente bloque en el mismo take
-            # Si el siguiente bloque no se puede añadir, el bucle se romperá en la siguiente iteración
-
-        if best_takes is None:
-            return [], float('inf')
-
-        return best_takes, best_cost
-
-    best_takes, _ = dp(0)
-
+            finales.append((end + 1, personajes_en_take))
+
+        for personaje in tocados:
+            lineas_personaje[personaje] = 0
+        contadores['candidatos'] += len(finales)
+        return finales
+
+    def exacto(fin_plazo):
+        # Programación dinámica iterativa (del último bloque hacia el primero):
+        # coste[pos] = suma total mínima de takes por personaje desde pos al final
+        # siguiente[pos] = bloque donde empieza el take siguiente (puntero hacia atrás).
+        # Devuelve None si se supera fin_plazo.
+        coste = [float('inf')] * n + [0]
+        siguiente = [None] * n
+        for pos in range(n - 1, -1, -1):
+            if fin_plazo is not None and pos % 256 == 0 and time.perf_counter() > fin_plazo:
+                return None
+            for fin, personajes_en_take in finales_validos(pos):
+                # Cerrar el take aquí si mejora el coste
+                current_cost = coste[fin] + personajes_en_take
+                if current_cost < coste[pos]:
+                    coste[pos] = current_cost
+                    siguiente[pos] = fin
+        return coste[0], siguiente
+
+    def voraz():
+        # Cada take se alarga hasta el último bloque que cabe. Se recorre la escena una vez.
+        coste = 0
+        siguiente = [None] * n
+        pos = 0
+        while pos < n:
+            finales = finales_validos(pos)
+            if not finales:
+                return float('inf'), siguiente
+            siguiente[pos], personajes_en_take = finales[-1]
+            coste += personajes_en_take
+            pos = siguiente[pos]
+        return coste, siguiente
+
+    inicio = time.perf_counter()
+    resultado = None
+    plazo_agotado = False
+    motor_usado = 'voraz' if motor == 'voraz' or (motor == 'auto' and n > limite_bloques) else 'exacto'
+    if motor_usado == 'exacto':
+        fin_plazo = inicio + limite_segundos if motor == 'auto' and limite_segundos is not None else None
+        resultado = exacto(fin_plazo)
+        if resultado is None:
+            logging.warning(f"Escena {escena.escena}: se superaron {limite_segundos} s con el motor exacto; se usa el voraz")
+            motor_usado = 'voraz'
+            plazo_agotado = True
+    if resultado is None:
+        resultado = voraz()
+    coste_total, siguiente = resultado
+
+    # Reconstruir los takes una sola vez siguiendo los punteros
     takes = []
-    take_id = 1
-    for take_intervenciones in best_takes:
-        take_intervenciones = list(take_intervenciones)
-        takes.append({
-            'take': take_id,
-            'in': take_intervenciones[0]['in_td'],
-            'out': take_intervenciones[-1]['out_td'],
-            'scene': take_intervenciones[0]['SCENE'],
-            'lineas': take_intervenciones
+    if coste_total != float('inf'):
+        pos = 0
+        while pos < n:
+            fin = siguiente[pos]
+            takes.append((inicio_bloques[pos], inicio_bloques[fin]))
+            pos = fin
+
+    if estadisticas is not None:
+        cota = cota_inferior_takes(escena, max_frames_take, max_lineas_take, max_lineas_por_personaje)
+        coste_valido = coste_total if coste_total != float('inf') else None
+        estadisticas.update({
+            'escena': escena.escena,
+            'motor': motor_usado,
+            # El motor voraz se usó por tiempo: depende de la carga del equipo, no del guion
+            'plazo_agotado': plazo_agotado,
+            'lineas': len(escena),
+            'bloques': n,
+            'estados': n,
+            'extensiones': contadores['extensiones'],
+            'candidatos': contadores['candidatos'],
+            'takes': len(takes),
+            'coste': coste_valido,
+            'cota_inferior': cota,
+            # Brecha relativa respecto a la cota inferior (0 = coste igual a la cota)
+            'brecha': round((coste_valido - cota) / cota, 4) if coste_valido is not None and cota else None,
         })
-        take_id += 1
 
     return takes
 
 # 6. Asignar *takes* optimizados
-def asignar_takes_optimizado(df):
-    df = df.reset_index(drop=True)
+def optimizar_escena_con_estadisticas(escena, **limites):
+    # Devuelve (takes, estadisticas) para poder recoger las estadísticas desde otro proceso
+    inicio = time.perf_counter()
+    estadisticas = {}
+    takes = optimizar_takes_escena(escena, estadisticas=estadisticas, **limites)
+    estadisticas['segundos'] = round(time.perf_counter() - inicio, 6)
+    return takes, estadisticas
+
+class ProcesoCancelado(Exception):
+    # Se lanza cuando se activa el evento cancelar antes de terminar todas las escenas
+    pass
+
+# Cada cuánto se comprueba la cancelación mientras los procesos del pool optimizan
+ESPERA_CANCELACION = 0.1
+
+class ProgresoEscenas:
+    # Progreso de la optimización con una estimación del tiempo restante. El trabajo de cada
+    # escena se estima por su número de líneas, así que una escena larga avanza más la
+    # barra que una corta. Los mensajes se limitan a uno cada 'intervalo' segundos.
+    def __init__(self, escenas, status, intervalo=0.25):
+        self.pesos = [max(1, len(escena)) for escena in escenas]
+        self.total = sum(self.pesos)
+        self.status = status
+        self.intervalo = intervalo
+        self.hecho = 0
+        self.hechas = 0
+        self.inicio = time.perf_counter()
+        self.ultimo_mensaje = None
+
+    def escena_terminada(self, indice):
+        self.hecho += self.pesos[indice]
+        self.hechas += 1
+        ahora = time.perf_counter()
+        terminado = self.hechas == len(self.pesos)
+        if not terminado and self.ultimo_mensaje is not None and ahora - self.ultimo_mensaje < self.intervalo:
+            return
+        self.ultimo_mensaje = ahora
+        self.status(self.texto(ahora - self.inicio))
+
+    def texto(self, transcurrido):
+        fraccion = self.hecho / self.total
+        texto = f"Optimizando escenas: {self.hechas}/{len(self.pesos)} ({fraccion:.0%})"
+        if 0 < fraccion < 1:
+            texto += f", quedan ~{formatear_duracion(transcurrido * (1 - fraccion) / fraccion)}"
+        return texto
+
+def formatear_duracion(segundos):
+    segundos = round(segundos)
+    return f"{segundos // 60} min {segundos % 60:02d} s" if segundos >= 60 else f"{segundos} s"
+
+def terminar_procesos(executor):
+    # Detiene ya los procesos del pool, también la escena que estén optimizando.
+    # ProcessPoolExecutor.terminate_workers solo existe desde Python 3.14.
+    terminar = getattr(executor, 'terminate_workers', None)
+    if terminar is not None:
+        terminar()
+        return
+    for proceso in list((getattr(executor, '_processes', None) or {}).values()):
+        proceso.terminate()
+
+def procesos_para(lineas, tareas, num_workers):
+    # Procesos del pool para 'tareas' independientes con 'lineas' en total (1 = sin pool)
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    if lineas < MIN_LINEAS_PROCESOS:
+        return 1
+    return max(1, min(num_workers, tareas))
+
+def optimizar_escenas(escenas, num_workers=1, cancelar=None, progreso=None, **limites):
+    # Las escenas son independientes: con num_workers > 1 y al menos MIN_LINEAS_PROCESOS líneas
+    # se reparten en un pool de procesos (None = todos los núcleos). Devuelve una lista de (takes, estadisticas)
+    # en el mismo orden que las escenas recibidas. limites se pasa a optimizar_takes_escena.
+    # cancelar (threading.Event, opcional) se comprueba entre escena y escena; con el pool,
+    # además se terminan los procesos para liberar los núcleos en el momento. Sin pool, la
+    # escena en curso termina antes de cancelar (como mucho limite_segundos con motor 'auto').
+    # progreso (ProgresoEscenas, opcional) se avisa al terminar cada escena.
+    optimizar = functools.partial(optimizar_escena_con_estadisticas, **limites)
+    num_workers = procesos_para(sum(len(escena) for escena in escenas), len(escenas), num_workers)
+    if num_workers <= 1:
+        resultados = []
+        for i, escena in enumerate(escenas):
+            if cancelar is not None and cancelar.is_set():
+                raise ProcesoCancelado()
+            resultados.append(optimizar(escena))
+            if progreso is not None:
+                progreso.escena_terminada(i)
+        return resultados
+
+    resultados = [None] * len(escenas)
+    executor = ProcessPoolExecutor(max_workers=num_workers)
+    try:
+        # Enviar primero las escenas más largas para repartir mejor la carga
+        orden = sorted(range(len(escenas)), key=lambda i: len(escenas[i]), reverse=True)
+        futuros = {executor.submit(optimizar, escenas[i]): i for i in orden}
+        pendientes = set(futuros)
+        while pendientes:
+            terminados, pendientes = wait(pendientes, timeout=ESPERA_CANCELACION if cancelar is not None else None,
+                                          return_when=FIRST_COMPLETED)
+            if cancelar is not None and cancelar.is_set():
+                terminar_procesos(executor)
+                raise ProcesoCancelado()
+            for futuro in terminados:
+                resultados[futuros[futuro]] = futuro.result()
+                if progreso is not None:
+                    progreso.escena_terminada(futuros[futuro])
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return resultados
+
+# Caché persistente de resultados por escena
+# Versión del formato y del optimizador: cambiarla invalida todas las entradas guardadas
+VERSION_CACHE = 2
+
+def ruta_cache_por_defecto():
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'Takeo', 'escenas.sqlite')
+
+def clave_escena(escena, limites):
+    # Hash del contenido que decide el resultado: personajes por línea, frames relativos al
+    # inicio de la escena (así se reconocen escenas repetidas en otros minutos u otros
+    # episodios) y parámetros del optimizador, con los valores por defecto ya aplicados
+    parametros = inspect.signature(optimizar_takes_escena).bind_partial(escena, **limites)
+    parametros.apply_defaults()
+    parametros = {nombre: valor for nombre, valor in parametros.arguments.items()
+                  if nombre not in ('intervenciones_escena', 'estadisticas')}
+
+    origen = int(escena.in_frames[0]) if len(escena) else 0
+    resumen = hashlib.blake2b(digest_size=20)
+    resumen.update(json.dumps([VERSION_CACHE, parametros, escena.nombres], sort_keys=True, default=str).encode('utf-8'))
+    resumen.update(np.asarray(escena.personajes, dtype=np.int32).tobytes())
+    resumen.update((escena.in_frames - origen).tobytes())
+    resumen.update((escena.out_frames - origen).tobytes())
+    return resumen.hexdigest()
+
+class CacheEscenas:
+    # Resultados del optimizador guardados en SQLite por clave_escena, con un tamaño máximo:
+    # al superarlo se borran las entradas usadas hace más tiempo. Es seguro usarla desde
+    # varios procesos a la vez (cada operación abre su propia conexión).
+    def __init__(self, ruta=None, max_bytes=64 * 2**20):
+        self.ruta = ruta or ruta_cache_por_defecto()
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+        with self.conectar() as conexion:
+            conexion.execute("CREATE TABLE IF NOT EXISTS escenas (clave TEXT PRIMARY KEY, valor TEXT NOT NULL, "
+                             "tamano INTEGER NOT NULL, ultimo_uso REAL NOT NULL)")
+            conexion.execute("CREATE INDEX IF NOT EXISTS escenas_uso ON escenas (ultimo_uso)")
+
+    @contextlib.contextmanager
+    def conectar(self):
+        conexion = sqlite3.connect(self.ruta, timeout=30)
+        try:
+            with conexion:
+                yield conexion
+        finally:
+            conexion.close()
+
+    def obtener(self, claves):
+        # Devuelve {clave: (takes, estadisticas)} para las claves guardadas
+        claves = list(set(claves))
+        encontrados = {}
+        with self.conectar() as conexion:
+            for i in range(0, len(claves), 500):
+                lote = claves[i:i + 500]
+                marcas = ','.join('?' * len(lote))
+                for clave, valor in conexion.execute(f"SELECT clave, valor FROM escenas WHERE clave IN ({marcas})", lote):
+                    datos = json.loads(valor)
+                    encontrados[clave] = ([tuple(take) for take in datos['takes']], datos['estadisticas'])
+                conexion.execute(f"UPDATE escenas SET ultimo_uso = ? WHERE clave IN ({marcas})", [time.time(), *lote])
+        return encontrados
+
+    def guardar(self, resultados):
+        # resultados: {clave: (takes, estadisticas)}. No se guardan las escenas en las que el
+        # motor exacto agotó limite_segundos: con el equipo libre podría terminar a tiempo.
+        filas = []
+        for clave, (takes, estadisticas) in resultados.items():
+            if estadisticas.get('plazo_agotado'):
+                continue
+            valor = json.dumps({'takes': [[int(inicio), int(fin)] for inicio, fin in takes], 'estadisticas': estadisticas},
+                               default=valor_json)
+            filas.append((clave, valor, len(valor), time.time()))
+        if not filas:
+            return
+        with self.conectar() as conexion:
+            conexion.executemany("INSERT OR REPLACE INTO escenas (clave, valor, tamano, ultimo_uso) VALUES (?, ?, ?, ?)", filas)
+            self.recortar(conexion)
 
-    escenas = df['SCENE'].unique()
-    all_takes = []
-    take_global_id = 1
+    def recortar(self, conexion):
+        total = conexion.execute("SELECT COALESCE(SUM(tamano), 0) FROM escenas").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Borrar las entradas menos usadas hasta quedar por debajo del 90 % del máximo
+        sobrante = total - int(self.max_bytes * 0.9)
+        borrar = []
+        for clave, tamano in conexion.execute("SELECT clave, tamano FROM escenas ORDER BY ultimo_uso"):
+            borrar.append((clave,))
+            sobrante -= tamano
+            if sobrante <= 0:
+                break
+        conexion.executemany("DELETE FROM escenas WHERE clave = ?", borrar)
 
-    for escena in escenas:
-        intervenciones_escena = df[df['SCENE'] == escena]
-        takes_escena = optimizar_takes_escena(intervenciones_escena)
-        for take in takes_escena:
-            take['take'] = take_global_id
+def abrir_cache_escenas():
+    # Caché por defecto de la interfaz; si no se puede crear, se sigue sin caché
+    if not USAR_CACHE_ESCENAS:
+        return None
+    try:
+        return CacheEscenas(max_bytes=MAX_BYTES_CACHE_ESCENAS)
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"No se pudo abrir la caché de escenas: {e}")
+        return None
+
+def dividir_en_escenas(df):
+    # Partir el DataFrame (con índice 0..n-1) por escena una sola vez, en orden de aparición,
+    # para pasar al optimizador (o a los procesos del pool) solo la representación compacta.
+    # Las columnas se convierten a arrays una vez y cada escena toma sus filas, en lugar de
+    # crear un DataFrame por escena; las filas sin escena se descartan, como en groupby.
+    codigos_escena, escenas = pd.factorize(df['SCENE'])
+    codigos_personaje, nombres = pd.factorize(df['PERSONAJE'], use_na_sentinel=False)
+    nombres = [str(p) for p in nombres]
+    filas = df.index.to_numpy()
+    in_frames = df['in_frames'].to_numpy(dtype=np.int64)
+    out_frames = df['out_frames'].to_numpy(dtype=np.int64)
+
+    orden = np.argsort(codigos_escena, kind='stable')
+    limites = np.searchsorted(codigos_escena[orden], np.arange(len(escenas) + 1))
+    resultado = []
+    for i in range(len(escenas)):
+        seleccion = orden[limites[i]:limites[i + 1]]
+        resultado.append(EscenaCompacta.desde_columnas(escenas[i], filas[seleccion], codigos_personaje[seleccion], nombres,
+                                                       in_frames[seleccion], out_frames[seleccion]))
+    return resultado
+
+def resultado_desde_cache(escena, guardado):
+    takes_escena, estadisticas = guardado
+    return takes_escena, {**estadisticas, 'escena': escena.escena, 'segundos': 0.0, 'desde_cache': True}
+
+def asignar_takes_optimizado(df, num_workers=1, metricas=None, cache=None, cancelar=None, status=None, **limites):
+    # status (opcional) recibe el progreso por escena de las escenas que no estaban en caché
+    df = df.reset_index(drop=True)
+    escenas = dividir_en_escenas(df)
+
+    # Con caché, solo se optimizan las escenas que no se habían visto antes
+    resultados = [None] * len(escenas)
+    claves = []
+    if cache is not None:
+        claves = [clave_escena(escena, limites) for escena in escenas]
+        guardados = cache.obtener(claves)
+        for i, clave in enumerate(claves):
+            if clave in guardados:
+                resultados[i] = resultado_desde_cache(escenas[i], guardados[clave])
+        if metricas is not None:
+            aciertos = sum(resultado is not None for resultado in resultados)
+            metricas.contar_cache('escenas', aciertos, len(escenas) - aciertos)
+
+    pendientes = [i for i, resultado in enumerate(resultados) if resultado is None]
+    progreso = ProgresoEscenas([escenas[i] for i in pendientes], status) if status is not None and pendientes else None
+    nuevos = optimizar_escenas([escenas[i] for i in pendientes], num_workers, cancelar=cancelar, progreso=progreso, **limites)
+    for i, resultado in zip(pendientes, nuevos):
+        resultados[i] = resultado
+    if cache is not None and pendientes:
+        cache.guardar({claves[i]: resultados[i] for i in pendientes})
+    return tabla_takes(df, escenas, resultados, metricas)
+
+def tabla_takes(df, escenas, resultados, metricas=None):
+    # Numeración global de takes en el orden de las escenas
+    filas = []
+    numeros_take = []
+    take_global_id = 1
+    for escena, (takes_escena, estadisticas) in zip(escenas, resultados):
+        if metricas is not None and estadisticas:
+            metricas.escenas.append(estadisticas)
+        for inicio, fin in takes_escena:
+            filas.append(escena.filas[inicio:fin])
+            numeros_take.append(np.full(fin - inicio, take_global_id, dtype=np.int64))
             take_global_id += 1
-            all_takes.append(take)
-
-    take_list = []
-    for take in all_takes:
-        for linea in take['lineas']:
-            take_list.append({
-                'TAKE': take['take'],
-                'IN': linea['IN'],
-                'OUT': linea['OUT'],
-                'PERSONAJE': linea['personaje'],
-                'DIÁLOGO': linea['dialogo'],
-                'DURACIÓN': linea['duracion'],
-                'SCENE': take['scene']
-            })
-
-    return pd.DataFrame(take_list)
+
+    filas = np.concatenate(filas) if filas else np.array([], dtype=np.int64)
+    lineas = df.iloc[filas]
+    # .array conserva las columnas categóricas (solo se copian los códigos)
+    return pd.DataFrame({
+        'TAKE': np.concatenate(numeros_take) if numeros_take else np.array([], dtype=np.int64),
+        'IN': lineas['IN'].array,
+        'OUT': lineas['OUT'].array,
+        'PERSONAJE': lineas['PERSONAJE'].array,
+        'DIÁLOGO': lineas['DIÁLOGO'].array,
+        'DURACIÓN': lineas['duracion'].array,
+        'SCENE': lineas['SCENE'].array,
+    })
+
+# Barrido de límites: el mismo guion preparado y dividido en escenas se optimiza con
+# cada combinación de una rejilla para comparar los takes por personaje de cada norma
+ABREVIATURAS_LIMITES = {'max_duracion_take': 'dur', 'max_lineas_take': 'lin',
+                        'max_lineas_consecutivas': 'cons', 'max_lineas_por_personaje': 'pers'}
+
+def combinaciones_rejilla(rejilla):
+    # {'max_lineas_take': [8, 10], 'max_duracion_take': [25, 30]} -> lista de dicts, en orden de la rejilla
+    nombres = list(rejilla)
+    return [dict(zip(nombres, valores)) for valores in itertools.product(*(rejilla[nombre] for nombre in nombres))]
+
+def etiqueta_combinacion(combinacion):
+    return " ".join(f"{ABREVIATURAS_LIMITES.get(nombre, nombre)}={valor:g}" if isinstance(valor, float) else
+                    f"{ABREVIATURAS_LIMITES.get(nombre, nombre)}={valor}" for nombre, valor in combinacion.items())
+
+def optimizar_escena_combinaciones(escena, combinaciones):
+    # Una tarea del pool por escena: se envía una sola vez y se optimiza con cada combinación
+    return [optimizar_escena_con_estadisticas(escena, **limites) for limites in combinaciones]
+
+def barrido_limites(df, rejilla, selected_personajes=None, num_workers=None, frame_rate=FRAME_RATE, max_caracteres=60,
+                    cache=None, status=None, **fijos):
+    # Devuelve (comparacion, configuraciones): takes por personaje con una columna por
+    # combinación (y la fila de suma total) y una fila por combinación con sus límites y totales.
+    # fijos son parámetros del optimizador comunes a todas las combinaciones (p. ej. motor).
+    if status is None:
+        status = logging.info
+    combinaciones = combinaciones_rejilla(rejilla)
+    parametros = [{**fijos, **combinacion, 'frame_rate': frame_rate} for combinacion in combinaciones]
+
+    if selected_personajes is not None:
+        df = df[df['PERSONAJE'].isin(selected_personajes)]
+    df = preparar_guion(df.reset_index(drop=True), status, frame_rate, max_caracteres).reset_index(drop=True)
+    escenas = dividir_en_escenas(df)
+
+    # resultados[c][e]: takes de la escena e con la combinación c
+    resultados = [[None] * len(escenas) for _ in combinaciones]
+    claves = {}
+    if cache is not None:
+        claves = {(c, e): clave_escena(escena, limites) for c, limites in enumerate(parametros) for e, escena in enumerate(escenas)}
+        guardados = cache.obtener(claves.values())
+        for (c, e), clave in claves.items():
+            if clave in guardados:
+                resultados[c][e] = resultado_desde_cache(escenas[e], guardados[clave])
+
+    pendientes = {e: [c for c in range(len(combinaciones)) if resultados[c][e] is None] for e in range(len(escenas))}
+    pendientes = {e: combos for e, combos in pendientes.items() if combos}
+    status(f"Optimizando {len(escenas)} escenas con {len(combinaciones)} combinaciones de límites...")
+
+    num_workers = procesos_para(sum(len(escenas[e]) * len(combos) for e, combos in pendientes.items()), len(pendientes), num_workers)
+    # Primero las tareas más largas para repartir mejor la carga
+    orden = sorted(pendientes, key=lambda e: len(escenas[e]) * len(pendientes[e]), reverse=True)
+    if num_workers <= 1:
+        nuevos = {e: optimizar_escena_combinaciones(escenas[e], [parametros[c] for c in pendientes[e]]) for e in orden}
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futuros = {executor.submit(optimizar_escena_combinaciones, escenas[e], [parametros[c] for c in pendientes[e]]): e for e in orden}
+            nuevos = {futuros[futuro]: futuro.result() for futuro in as_completed(futuros)}
+    for e, resultados_escena in nuevos.items():
+        for c, resultado in zip(pendientes[e], resultados_escena):
+            resultados[c][e] = resultado
+    if cache is not None and nuevos:
+        cache.guardar({claves[c, e]: resultados[c][e] for e in nuevos for c in pendientes[e]})
+
+    totales = {}
+    configuraciones = []
+    for combinacion, resultados_combinacion in zip(combinaciones, resultados):
+        etiqueta = etiqueta_combinacion(combinacion)
+        takes_por_personaje, suma_total_takes = calcular_total_takes_por_personaje(tabla_takes(df, escenas, resultados_combinacion))
+        totales[etiqueta] = takes_por_personaje.set_index('PERSONAJE')['TOTAL_TAKES']
+        estadisticas = [estadisticas for _, estadisticas in resultados_combinacion]
+        configuraciones.append({
+            'CONFIGURACION': etiqueta,
+            **combinacion,
+            'TAKES': sum(len(takes_escena) for takes_escena, _ in resultados_combinacion),
+            'SUMA_TOTAL_TAKES': int(suma_total_takes),
+            'COTA_INFERIOR': sum(e.get('cota_inferior') or 0 for e in estadisticas),
+            'ESCENAS_APROXIMADAS': sum(1 for e in estadisticas if e.get('motor') == 'voraz'),
+            'SEGUNDOS': round(sum(e.get('segundos', 0) for e in estadisticas), 3),
+        })
+
+    comparacion = pd.DataFrame(totales).fillna(0).astype('int64')
+    comparacion.index.name = 'PERSONAJE'
+    comparacion = comparacion.sort_index().reset_index()
+    total = pd.DataFrame([{'PERSONAJE': 'Suma total de Takes:', **{c: int(comparacion[c].sum()) for c in totales}}])
+    comparacion = pd.concat([comparacion, total], ignore_index=True)
+    return comparacion, pd.DataFrame(configuraciones)
 
 # 7. Calcular el total de *takes* por personaje
 def calcular_total_takes_por_personaje(df_takes):
-    takes_por_personaje = df_takes.groupby('PERSONAJE')['TAKE'].nunique().reset_index()
+    takes_por_personaje = df_takes.groupby('PERSONAJE', observed=True)['TAKE'].nunique().reset_index()
+    personajes = takes_por_personaje['PERSONAJE']
+    if isinstance(personajes.dtype, pd.CategoricalDtype):
+        # El resumen es pequeño: los nombres se devuelven como texto, sin las categorías del guion
+        takes_por_personaje['PERSONAJE'] = personajes.astype(personajes.cat.categories.dtype)
     takes_por_personaje.rename(columns={'TAKE': 'TOTAL_TAKES'}, inplace=True)
     suma_total_takes = takes_por_personaje['TOTAL_TAKES'].sum()
     return takes_por_personaje, suma_total_takes
 
 # 8. Leer archivo
-def leer_archivo(file_path):
-    try:
-        return pd.read_excel(file_path)
-    except FileNotFoundError:
-        messagebox.showerror("Error", f"El archivo '{file_path}' no se encontró.")
-    except Exception as e:
-        logging.error(f"Error al leer el archivo Excel: {e}")
-    return None
+# Formatos de tabla admitidos para guiones y takes, por extensión. Las extensiones
+# desconocidas se intentan abrir como Excel, como hasta ahora.
+FORMATOS_TABLA = {'.xlsx': 'excel', '.xlsm': 'excel', '.xls': 'excel', '.csv': 'csv',
+                  '.parquet': 'parquet', '.feather': 'feather', '.arrow': 'feather'}
+# Formatos de salida de los takes (--formato en la línea de comandos)
+FORMATOS_SALIDA = ('xlsx', 'csv', 'parquet', 'feather')
+
+def formato_tabla(ruta):
+    return FORMATOS_TABLA.get(os.path.splitext(ruta)[1].lower(), 'excel')
+
+def comprobar_pyarrow(ruta):
+    # Parquet y Feather necesitan pyarrow, que es opcional (Takeo.spec no lo incluye)
+    if formato_tabla(ruta) in ('parquet', 'feather') and importlib.util.find_spec('pyarrow') is None:
+        raise ImportError(f"Los archivos {os.path.splitext(ruta)[1]} necesitan pyarrow, que no está instalado "
+                          f"en esta versión de Takeo. Use un archivo Excel o CSV.")
+
+def leer_tabla(ruta):
+    comprobar_pyarrow(ruta)
+    formato = formato_tabla(ruta)
+    if formato == 'csv':
+        # utf-8-sig acepta también los CSV con BOM que guarda Excel
+        return pd.read_csv(ruta, encoding='utf-8-sig')
+    if formato == 'parquet':
+        return pd.read_parquet(ruta)
+    if formato == 'feather':
+        return pd.read_feather(ruta)
+    # Para .xlsx pandas abre el libro con openpyxl en modo de solo lectura (read_only, data_only)
+    return pd.read_excel(ruta)
+
+def columnas_para_arrow(df):
+    # Parquet y Feather exigen un solo tipo por columna: las columnas con valores
+    # mezclados (p. ej. SCENE con 12 y '12A') se guardan como texto
+    df = df.reset_index(drop=True)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            if len({type(valor) for valor in df[col].cat.categories}) <= 1:
+                continue
+            df[col] = df[col].astype(object)
+        elif df[col].dtype != object:
+            continue
+        if len({type(valor) for valor in df[col].dropna()}) > 1:
+            df[col] = df[col].map(lambda valor: valor if pd.isna(valor) else str(valor))
+    return df
+
+def escribir_tabla(df, ruta):
+    comprobar_pyarrow(ruta)
+    formato = formato_tabla(ruta)
+    if formato == 'csv':
+        df.to_csv(ruta, index=False, encoding='utf-8')
+    elif formato == 'parquet':
+        columnas_para_arrow(df).to_parquet(ruta, index=False)
+    elif formato == 'feather':
+        columnas_para_arrow(df).to_feather(ruta)
+    else:
+        df.to_excel(ruta, index=False)
+
+# Columnas con muchos valores repetidos (más aún tras dividir los diálogos): como categóricas
+# cada fila guarda un código entero y cada texto distinto se guarda una sola vez
+COLUMNAS_CATEGORICAS = ('PERSONAJE', 'SCENE', 'IN', 'OUT')
+
+def compactar_columnas(df):
+    for col in COLUMNAS_CATEGORICAS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+def memoria_df(df):
+    # Bytes ocupados por el DataFrame, incluidos los textos de las columnas de objetos
+    return int(df.memory_usage(deep=True).sum())
+
+def leer_guion(file_path):
+    return compactar_columnas(leer_tabla(file_path))
+
+class GuionCargado:
+    # Guion leído una sola vez y compartido entre la ventana de personajes y el procesamiento
+    def __init__(self, file_path, df, segundos_lectura=0.0):
+        self.file_path = file_path
+        self.df = df
+        self.segundos_lectura = segundos_lectura
+        # Número de líneas de cada personaje, para mostrarlo en la ventana de selección
+        self.lineas_por_personaje = df['PERSONAJE'].value_counts().to_dict() if 'PERSONAJE' in df.columns else {}
+        self.personajes = sorted(self.lineas_por_personaje)
+
+    @classmethod
+    def cargar(cls, file_path):
+        inicio = time.perf_counter()
+        df = leer_guion(file_path)
+        return cls(file_path, df, time.perf_counter() - inicio)
 
 # Función auxiliar para formatear diálogos
 def formatear_dialogo(dialogo, tab_size=4, acumulado=False):
@@ -279,68 +1099,527 @@ def formatear_dialogo(dialogo, tab_size=4, acumulado=False):
         else:
             return lineas[0] + "\n" + "\n".join([f"{tab}<< {linea}" for linea in lineas[1:]])
 
-# 9. Función para transformar Excel a TXT
-def transformar_excel_a_txt(ruta_excel, ruta_salida_txt):
-    # Obtener el nombre del archivo sin la extensión y en mayúsculas
-    nombre_archivo = os.path.splitext(os.path.basename(ruta_excel))[0].upper()
+# 9. Generar el TXT de diálogos
+# Textos que pd.read_excel interpreta como vacíos: se aplican también a los takes en
+# memoria para que el TXT salga idéntico al generado releyendo el Excel exportado
+VALORES_NA_EXCEL = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+                    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
 
-    # Leer datos del Excel
-    df = pd.read_excel(ruta_excel)
+def nombre_dialogo(ruta_excel):
+    # Nombre del archivo sin la extensión y en mayúsculas
+    return os.path.splitext(os.path.basename(ruta_excel))[0].upper()
 
-    # Asegurarnos de que las columnas necesarias existen
-    columnas_necesarias = ["TAKE", "IN", "OUT", "PERSONAJE", "DIÁLOGO", "DURACIÓN", "SCENE"]
-    for col in columnas_necesarias:
-        if col not in df.columns:
-            raise ValueError(f"Falta la columna requerida: {col}")
+def lineas_dialogo(df_takes, nombre_archivo):
+    # Genera el TXT línea a línea. Las intervenciones seguidas de un mismo personaje dentro
+    # de un take se agrupan por tramos (run-length) comparando columnas completas.
+    df = df_takes.dropna(subset=["TAKE"]).sort_values("TAKE", kind="stable")
+    columnas = {}
+    for col in ("IN", "OUT", "PERSONAJE", "DIÁLOGO"):
+        columnas[col] = df[col].where(~df[col].isin(VALORES_NA_EXCEL))
 
     # Convertir todo en texto para prevenir problemas con valores no string
-    df["DIÁLOGO"] = df["DIÁLOGO"].astype(str)
+    dialogos = [formatear_dialogo(d, acumulado=True) for d in columnas["DIÁLOGO"].astype(str)]
 
     # Reemplazar ":" por " " en IN y OUT
-    df["IN"] = df["IN"].str.replace(":", " ", regex=False)
-    df["OUT"] = df["OUT"].str.replace(":", " ", regex=False)
-
-    # Agrupar por TAKE
-    agrupado_por_take = df.groupby("TAKE")
-
+    tc_in = columnas["IN"].str.replace(":", " ", regex=False).tolist()
+    tc_out = columnas["OUT"].str.replace(":", " ", regex=False).tolist()
+    personajes = columnas["PERSONAJE"].to_numpy(dtype=object)
+    takes = df["TAKE"].to_numpy(dtype=object)
+
+    # Un tramo empieza donde cambia el take o el personaje (NaN nunca es igual a NaN,
+    # así que cada fila sin personaje es un tramo propio)
+    num_filas = len(takes)
+    cambio_take = np.ones(num_filas, dtype=bool)
+    cambio_take[1:] = takes[1:] != takes[:-1]
+    cambio_tramo = cambio_take.copy()
+    cambio_tramo[1:] |= ~(personajes[1:] == personajes[:-1]).astype(bool)
+    inicios_take = np.flatnonzero(cambio_take).tolist() + [num_filas]
+    inicios_tramo = np.flatnonzero(cambio_tramo).tolist() + [num_filas]
+
+    # Escribir el nombre del archivo al principio
+    yield f"{nombre_archivo}\n\n"
+
+    tramo = 0
+    for inicio, fin in zip(inicios_take, inicios_take[1:]):
+        yield f"TAKE {takes[inicio]}\n"
+        yield f"{tc_in[inicio]}\n"  # TC de IN
+        while inicios_tramo[tramo] < fin:
+            a, b = inicios_tramo[tramo], inicios_tramo[tramo + 1]
+            personaje = personajes[a]
+            # Los tramos sin nombre de personaje (cadena vacía) no se escriben
+            if personaje:
+                yield f"{personaje}:\t{' '.join(dialogos[a:b])}\n"
+            tramo += 1
+        # Escribir el OUT del último diálogo del TAKE
+        yield f"{tc_out[fin - 1]}\n\n"
+
+def generar_dialogo_txt(df_takes, nombre_archivo, ruta_salida_txt):
+    # Escribe el TXT directamente desde los takes en memoria, sin construirlo entero
     with open(ruta_salida_txt, "w", encoding="utf-8") as archivo_salida:
-        # Escribir el nombre del archivo al principio
-        archivo_salida.write(f"{nombre_archivo}\n\n")
+        archivo_salida.writelines(lineas_dialogo(df_takes, nombre_archivo))
 
-        for take, grupo in agrupado_por_take:
-            archivo_salida.write(f"TAKE {take}\n")
-            archivo_salida.write(f"{grupo.iloc[0]['IN']}\n")  # TC de IN
+    print(f"Archivo de texto generado en: {ruta_salida_txt}")
 
-            dialogo_actual = ""  # Para acumular el diálogo combinado
-            personaje_actual = None
+# Función para transformar un archivo de takes ya exportado (Excel, CSV, Parquet o Feather) a TXT
+def transformar_excel_a_txt(ruta_excel, ruta_salida_txt):
+    # Leer los takes
+    df = leer_tabla(ruta_excel)
 
-            for idx, fila in grupo.iterrows():
-                personaje = fila["PERSONAJE"]
-                dialogo = formatear_dialogo(fila["DIÁLOGO"], acumulado=True)
+    # Asegurarnos de que las columnas necesarias existen
+    columnas_necesarias = ["TAKE", "IN", "OUT", "PERSONAJE", "DIÁLOGO", "DURACIÓN", "SCENE"]
+    for col in columnas_necesarias:
+        if col not in df.columns:
+            raise ValueError(f"Falta la columna requerida: {col}")
 
-                # Si el personaje actual es el mismo, acumular diálogo con espacio
-                if personaje == personaje_actual:
-                    dialogo_actual += f" {dialogo}"  # Concatenar con un espacio
-                else:
-                    # Si hay un personaje previo, escribir su diálogo acumulado
-                    if personaje_actual:
-                        archivo_salida.write(f"{personaje_actual}:\t{dialogo_actual}\n")
+    generar_dialogo_txt(df, nombre_dialogo(ruta_excel), ruta_salida_txt)
 
-                    # Cambiar al nuevo personaje y reiniciar diálogo acumulado
-                    personaje_actual = personaje
-                    dialogo_actual = dialogo
+# 10. Generar el takeo sin interfaz gráfica (compartido por la GUI y la línea de comandos)
+COLUMNAS_NECESARIAS = {'IN', 'OUT', 'PERSONAJE', 'DIÁLOGO', 'SCENE'}
 
-            # Escribir el último diálogo acumulado del TAKE
-            if personaje_actual:
-                archivo_salida.write(f"{personaje_actual}:\t{dialogo_actual}\n")
+def validar_columnas(df):
+    columnas_faltantes = COLUMNAS_NECESARIAS - set(df.columns)
+    if columnas_faltantes:
+        raise ValueError(f"Faltan las siguientes columnas: {', '.join(columnas_faltantes)}")
+
+def generar_takeo(df, selected_personajes=None, num_workers=1, status=None, frame_rate=FRAME_RATE, max_caracteres=60, metricas=None, cache=None,
+                  cancelar=None, **limites):
+    # Devuelve (df_prop_optimizada, takes_por_personaje, suma_total_takes).
+    # selected_personajes=None procesa todos los personajes; status recibe los mensajes de progreso,
+    # metricas (opcional) acumula los tiempos de cada etapa y cancelar (threading.Event, opcional)
+    # detiene la optimización con ProcesoCancelado.
+    if status is None:
+        status = logging.info
+    if metricas is None:
+        metricas = Metricas()
 
-            # Escribir el OUT del último diálogo del TAKE
-            archivo_salida.write(f"{grupo.iloc[-1]['OUT']}\n\n")
+    # Filtrar los personajes seleccionados
+    with metricas.etapa('filtro') as etapa:
+        if selected_personajes is not None:
+            df = df[df['PERSONAJE'].isin(selected_personajes)]
+        df = df.reset_index(drop=True)
+        etapa['filas'] = len(df)
+        etapa['bytes_df'] = memoria_df(df)
+
+    df = preparar_guion(df, status, frame_rate, max_caracteres, metricas)
+
+    status("Asignando *takes* optimizados...")
+    with metricas.etapa('optimizacion') as etapa:
+        df_prop_optimizada = asignar_takes_optimizado(df, num_workers=num_workers, metricas=metricas, cache=cache, cancelar=cancelar,
+                                                      status=status, frame_rate=frame_rate, **limites)
+        df_prop_optimizada['DURACIÓN'] = df_prop_optimizada['DURACIÓN'].astype(float)
+        etapa['filas'] = len(df_prop_optimizada)
+        etapa['bytes_df'] = memoria_df(df_prop_optimizada)
+
+    status("Calculando resumen de *takes* por personaje...")
+    with metricas.etapa('resumen') as etapa:
+        takes_por_personaje, suma_total_takes = calcular_total_takes_por_personaje(df_prop_optimizada)
+        etapa['filas'] = len(takes_por_personaje)
+    return df_prop_optimizada, takes_por_personaje, suma_total_takes
+
+def preparar_guion(df, status, frame_rate=FRAME_RATE, max_caracteres=60, metricas=None):
+    # Tiempos a frames, orden cronológico, división de diálogos largos y limpieza de texto.
+    # Todas las operaciones son fila a fila (y el orden es estable), así que filtrar
+    # personajes antes o después de preparar el guion da el mismo resultado.
+    if metricas is None:
+        metricas = Metricas()
+
+    status("Convirtiendo tiempos...")
+    with metricas.etapa('tiempos') as etapa:
+        # Los guiones leídos con leer_guion ya vienen compactados
+        df = compactar_columnas(df)
+        df['in_frames'] = timecodes_a_frames(df['IN'], frame_rate)
+        df['out_frames'] = timecodes_a_frames(df['OUT'], frame_rate)
+        df['duracion'] = (df['out_frames'] - df['in_frames']) / float(fps_real(frame_rate))
+        df = df.sort_values(by=['in_frames', 'out_frames']).reset_index(drop=True)
+        etapa['filas'] = len(df)
+        etapa['bytes_df'] = memoria_df(df)
+
+    # PERSONAJE no cambia al dividir los diálogos, así que se limpia antes (hay menos filas)
+    with metricas.etapa('limpieza_personaje') as etapa:
+        df['PERSONAJE'] = limpiar_columna(df['PERSONAJE'], metricas)
+        etapa['filas'] = len(df)
+
+    status("Dividiendo diálogos largos...")
+    with metricas.etapa('division') as etapa:
+        df = expandir_dialogos(df, max_caracteres)
+        etapa['filas'] = len(df)
+        etapa['bytes_df'] = memoria_df(df)
+
+    status("Limpiando texto...")
+    with metricas.etapa('limpieza_dialogo') as etapa:
+        df['DIÁLOGO'] = limpiar_columna(df['DIÁLOGO'], metricas)
+        etapa['filas'] = len(df)
+        etapa['bytes_df'] = memoria_df(df)
+    return df
+
+class PrevisualizacionTakes:
+    # Recuento de takes para una selección de personajes sin exportar nada. El guion
+    # completo se prepara (tiempos, división y limpieza) una sola vez; cada selección
+    # solo filtra las filas ya preparadas y vuelve a optimizar.
+    def __init__(self, df, frame_rate=FRAME_RATE, max_caracteres=60, cache=None, **limites):
+        self.df = df
+        self.frame_rate = frame_rate
+        self.max_caracteres = max_caracteres
+        self.cache = cache
+        self.limites = limites
+        self.preparado = None
+        self.lock = threading.Lock()
+
+    def guion_preparado(self):
+        with self.lock:
+            if self.preparado is None:
+                # Se conserva el nombre original para filtrar igual que generar_takeo
+                df = self.df.reset_index(drop=True)
+                df['PERSONAJE_ORIGINAL'] = df['PERSONAJE']
+                self.preparado = preparar_guion(df, logging.debug, self.frame_rate, self.max_caracteres)
+            return self.preparado
+
+    def calcular(self, selected_personajes, cancelar=None):
+        # Devuelve (takes_por_personaje, suma_total_takes); lanza ProcesoCancelado si se cancela
+        df = self.guion_preparado()
+        df = df[df['PERSONAJE_ORIGINAL'].isin(selected_personajes)].reset_index(drop=True)
+        df_takes = asignar_takes_optimizado(df, cache=self.cache, cancelar=cancelar, frame_rate=self.frame_rate, **self.limites)
+        return calcular_total_takes_por_personaje(df_takes)
+
+def rutas_salida(file_path, output_dir=None, formato_salida='xlsx'):
+    # Sin output_dir los archivos se crean en el directorio de trabajo, como desde la GUI
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    output_takes = f"{base_name}_TAKEO.{formato_salida}"
+    output_txt = f"{base_name}_DIALOG.txt"
+    if output_dir is not None:
+        output_takes = os.path.join(output_dir, output_takes)
+        output_txt = os.path.join(output_dir, output_txt)
+    return output_takes, output_txt
+
+def ruta_metricas(output_takes):
+    # Las métricas se guardan junto a los takes: <base>_TAKEO.json
+    return f"{os.path.splitext(output_takes)[0]}.json"
+
+def ruta_resumen(output_takes):
+    # Fuera de Excel el resumen por personaje va en su propio archivo: <base>_TAKEO_RESUMEN.<ext>
+    base, extension = os.path.splitext(output_takes)
+    return f"{base}_RESUMEN{extension}"
+
+# A partir de estas filas de takes el Excel se escribe en modo de memoria constante
+UMBRAL_FILAS_EXCEL_STREAMING = 20000
+
+# Formato de cabecera de to_excel hasta pandas 3 (el de los _TAKEO.xlsx de siempre)
+FORMATO_CABECERA_EXCEL = {'bold': True, 'top': 1, 'right': 1, 'bottom': 1, 'left': 1, 'align': 'center', 'valign': 'top'}
+
+def escribir_hoja_streaming(workbook, nombre_hoja, df, formato_cabecera, filas_por_bloque=5000):
+    # Escribe df fila a fila, por bloques de columnas; las celdas vacías se omiten como en to_excel
+    worksheet = workbook.add_worksheet(nombre_hoja)
+    for columna, nombre in enumerate(df.columns):
+        worksheet.write(0, columna, nombre, formato_cabecera)
+    fila_excel = 1
+    for inicio in range(0, len(df), filas_por_bloque):
+        bloque = df.iloc[inicio:inicio + filas_por_bloque]
+        vacias = bloque.isna().to_numpy()
+        columnas = [bloque[nombre].tolist() for nombre in bloque.columns]
+        for i, fila in enumerate(zip(*columnas)):
+            for columna, valor in enumerate(fila):
+                if vacias[i, columna]:
+                    continue
+                if isinstance(valor, float) and math.isinf(valor):
+                    valor = 'inf' if valor > 0 else '-inf'
+                worksheet.write(fila_excel, columna, valor)
+            fila_excel += 1
+    return worksheet, fila_excel - 1
+
+def exportar_excel_streaming(df_prop_optimizada, takes_por_personaje, suma_total_takes, output_excel):
+    # Modo constant_memory de xlsxwriter: cada fila se vuelca a disco al pasar a la
+    # siguiente, así que construir las hojas no añade memoria que crezca con el número de
+    # takes. La tabla de takes sí sigue en memoria: la comparten el TXT (que se escribe a la
+    # vez), el resumen por personaje y el valor que devuelve generar_takeo. Devuelve las filas escritas.
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(output_excel, {'constant_memory': True})
+    try:
+        formato_cabecera = workbook.add_format(FORMATO_CABECERA_EXCEL)
+        _, filas_escritas = escribir_hoja_streaming(workbook, 'Optimizada_Takes', df_prop_optimizada, formato_cabecera)
+        worksheet, last_row = escribir_hoja_streaming(workbook, 'Resumen', takes_por_personaje, formato_cabecera)
+        worksheet.write(last_row + 1, 0, 'Suma total de Takes:')
+        worksheet.write(last_row + 1, 1, suma_total_takes)
+    finally:
+        workbook.close()
+    return filas_escritas
+
+def exportar_excel(df_prop_optimizada, takes_por_personaje, suma_total_takes, output_excel, streaming=None):
+    # streaming=None elige el modo de memoria constante a partir de UMBRAL_FILAS_EXCEL_STREAMING
+    if streaming is None:
+        streaming = len(df_prop_optimizada) >= UMBRAL_FILAS_EXCEL_STREAMING
+    if streaming:
+        return exportar_excel_streaming(df_prop_optimizada, takes_por_personaje, suma_total_takes, output_excel)
+
+    with pd.ExcelWriter(output_excel, engine='xlsxwriter') as writer:
+        df_prop_optimizada.to_excel(writer, sheet_name='Optimizada_Takes', index=False)
+        takes_por_personaje.to_excel(writer, sheet_name='Resumen', index=False)
+        worksheet = writer.sheets['Resumen']
+        last_row = len(takes_por_personaje) + 1
+        worksheet.write(f'A{last_row + 1}', 'Suma total de Takes:')
+        worksheet.write(f'B{last_row + 1}', suma_total_takes)
+    return len(df_prop_optimizada)
+
+def exportar_takes(df_prop_optimizada, takes_por_personaje, suma_total_takes, output_takes, excel_streaming=None):
+    # Excel (dos hojas) para revisar a mano; CSV, Parquet o Feather para los lotes
+    # automáticos, con los takes y el resumen en dos archivos. Devuelve las filas escritas.
+    if formato_tabla(output_takes) == 'excel':
+        return exportar_excel(df_prop_optimizada, takes_por_personaje, suma_total_takes, output_takes, excel_streaming)
+    escribir_tabla(df_prop_optimizada, output_takes)
+    total = pd.DataFrame({'PERSONAJE': ['Suma total de Takes:'], 'TOTAL_TAKES': [suma_total_takes]})
+    escribir_tabla(pd.concat([takes_por_personaje, total], ignore_index=True), ruta_resumen(output_takes))
+    return len(df_prop_optimizada)
+
+def exportar_salidas(df_prop_optimizada, takes_por_personaje, suma_total_takes, output_excel, output_txt, metricas=None,
+                     excel_streaming=None, status=None):
+    # Los takes (Excel u otro formato, según la extensión de output_excel) y el TXT se
+    # escriben a la vez desde los takes en memoria. Devuelve los dos futuros ya
+    # terminados (takes, TXT) para tratar sus errores por separado. status (opcional)
+    # recibe un mensaje cada vez que termina de escribirse uno de los archivos.
+    if metricas is None:
+        metricas = Metricas()
+    escritos = []
+
+    def medir(nombre, ruta, funcion, *args):
+        with metricas.etapa(nombre) as etapa:
+            filas = funcion(*args)
+            etapa['filas'] = filas if filas is not None else len(df_prop_optimizada)
+        if status is not None:
+            escritos.append(ruta)
+            status(f"Exportando: {len(escritos)}/2 archivos escritos ({os.path.basename(ruta)}, "
+                   f"{metricas.etapas[nombre]['segundos']:.1f} s)")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futuro_excel = executor.submit(medir, f"exportar_{formato_tabla(output_excel)}", output_excel, exportar_takes,
+                                       df_prop_optimizada, takes_por_personaje, suma_total_takes, output_excel, excel_streaming)
+        futuro_txt = executor.submit(medir, 'exportar_txt', output_txt, generar_dialogo_txt, df_prop_optimizada,
+                                     nombre_dialogo(output_excel), output_txt)
+    return futuro_excel, futuro_txt
+
+def procesar_episodio(file_path, selected_personajes=None, excluded_personajes=None, output_dir=None, num_workers=1, status=None,
+                      formato_salida='xlsx', excel_streaming=None, df=None, **limites):
+    # Takeo completo de un guion sin interfaz: lee, optimiza y escribe _TAKEO.<formato_salida> y _DIALOG.txt.
+    # Los errores se propagan como excepciones; devuelve un resumen serializable a JSON.
+    # df permite pasar el guion ya leído (p. ej. desde una caché); si no, se lee file_path.
+    metricas = Metricas()
+    with metricas.etapa('lectura') as etapa:
+        if df is None:
+            df = leer_guion(file_path)
+        etapa['filas'] = len(df)
+        etapa['bytes_df'] = memoria_df(df)
+    validar_columnas(df)
+
+    if excluded_personajes:
+        excluidos = set(excluded_personajes)
+        personajes = selected_personajes if selected_personajes is not None else df['PERSONAJE'].dropna().unique()
+        selected_personajes = [p for p in personajes if p not in excluidos]
+
+    df_prop_optimizada, takes_por_personaje, suma_total_takes = generar_takeo(
+        df, selected_personajes, num_workers=num_workers, status=status, metricas=metricas, **limites)
+
+    output_excel, output_txt = rutas_salida(file_path, output_dir, formato_salida)
+    for futuro in exportar_salidas(df_prop_optimizada, takes_por_personaje, suma_total_takes, output_excel, output_txt, metricas,
+                                   excel_streaming, status):
+        futuro.result()
+    output_metricas = ruta_metricas(output_excel)
+    metricas.guardar_json(output_metricas)
+
+    return {
+        'archivo': file_path,
+        'excel': output_excel,
+        'txt': output_txt,
+        'metricas': output_metricas,
+        'etapas': {nombre: datos['segundos'] for nombre, datos in metricas.etapas.items()},
+        'filas_entrada': len(df),
+        'filas_takeo': len(df_prop_optimizada),
+        'takes': int(df_prop_optimizada['TAKE'].nunique()) if len(df_prop_optimizada) else 0,
+        'suma_total_takes': int(suma_total_takes),
+        'takes_por_personaje': {str(p): int(t) for p, t in zip(takes_por_personaje['PERSONAJE'], takes_por_personaje['TOTAL_TAKES'])},
+    }
+
+# Informe de temporada: takes por personaje de todos los episodios ya exportados (_TAKEO).
+# De cada episodio se leen solo las columnas TAKE y PERSONAJE y se devuelve su recuento por
+# personaje, así que la memoria depende del número de personajes y no del de filas. Los
+# recuentos se guardan en un JSON por ruta, tamaño y fecha de modificación: los episodios
+# sin cambios no se vuelven a leer.
+COLUMNAS_RECUENTO = ['TAKE', 'PERSONAJE']
+HOJA_TAKES = 'Optimizada_Takes'
+VERSION_RECUENTOS = 1
+
+def ruta_recuentos_por_defecto():
+    return os.path.join(os.path.dirname(ruta_cache_por_defecto()), 'recuentos_takes.json')
+
+def recuento_takes_archivo(ruta, filas_por_bloque=50000):
+    # Igual que calcular_total_takes_por_personaje, pero sin cargar el resto de columnas
+    comprobar_pyarrow(ruta)
+    formato = formato_tabla(ruta)
+    pares = set()
+    if formato == 'excel':
+        import openpyxl
+        libro = openpyxl.load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            hoja = libro[HOJA_TAKES] if HOJA_TAKES in libro.sheetnames else libro.worksheets[0]
+            filas = hoja.iter_rows(values_only=True)
+            cabecera = list(next(filas, ()))
+            faltan = [columna for columna in COLUMNAS_RECUENTO if columna not in cabecera]
+            if faltan:
+                raise ValueError(f"Faltan columnas en '{ruta}': {', '.join(faltan)}")
+            i_take, i_personaje = cabecera.index('TAKE'), cabecera.index('PERSONAJE')
+            for fila in filas:
+                if len(fila) > max(i_take, i_personaje):
+                    pares.add((fila[i_personaje], fila[i_take]))
+        finally:
+            libro.close()
+    elif formato == 'csv':
+        for bloque in pd.read_csv(ruta, usecols=COLUMNAS_RECUENTO, encoding='utf-8-sig', chunksize=filas_por_bloque):
+            pares.update(zip(bloque['PERSONAJE'], bloque['TAKE']))
+    else:
+        leer = pd.read_parquet if formato == 'parquet' else pd.read_feather
+        tabla = leer(ruta, columns=COLUMNAS_RECUENTO)
+        pares.update(zip(tabla['PERSONAJE'], tabla['TAKE']))
+
+    takes = {}
+    for personaje, take in pares:
+        if pd.isna(personaje) or pd.isna(take):
+            continue
+        takes[str(personaje)] = takes.get(str(personaje), 0) + 1
+    return takes
 
-    print(f"Archivo de texto generado en: {ruta_salida_txt}")
+def recuentos_en_paralelo(rutas, num_workers=None):
+    # Genera (ruta, recuento, error) a medida que terminan los episodios
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_workers = max(1, min(num_workers, len(rutas)))
+    if num_workers == 1:
+        for ruta in rutas:
+            try:
+                yield ruta, recuento_takes_archivo(ruta), None
+            except Exception as e:
+                yield ruta, None, e
+        return
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futuros = {executor.submit(recuento_takes_archivo, ruta): ruta for ruta in rutas}
+        for futuro in as_completed(futuros):
+            try:
+                yield futuros[futuro], futuro.result(), None
+            except Exception as e:
+                yield futuros[futuro], None, e
+
+def leer_recuentos(ruta):
+    try:
+        with open(ruta, encoding='utf-8') as archivo:
+            datos = json.load(archivo)
+    except (OSError, ValueError):
+        return {}
+    return datos.get('episodios', {}) if datos.get('version') == VERSION_RECUENTOS else {}
+
+def guardar_recuentos(ruta, recuentos):
+    guardar_json_atomico(ruta, {'version': VERSION_RECUENTOS, 'episodios': recuentos})
+
+def nombre_episodio(ruta):
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    return base[:-len('_TAKEO')] if base.upper().endswith('_TAKEO') else base
+
+def clave_natural(texto):
+    # EP_2 antes que EP_10
+    return [int(parte) if parte.isdigit() else parte.lower() for parte in re.split(r'(\d+)', texto)]
+
+def nombres_episodios(archivos):
+    # Si varios episodios se llaman igual, se usa su ruta relativa a la carpeta común de
+    # todos ellos (ShowA/S2/EP1, ShowB/S2/EP1), con la extensión si están en la misma carpeta
+    # (EP1.csv, EP1.parquet); si aun así coinciden, se añade un contador
+    grupos = {}
+    for ruta in archivos:
+        grupos.setdefault(nombre_episodio(ruta), []).append(ruta)
+    nombres = {}
+    for nombre, rutas in grupos.items():
+        if len(rutas) == 1:
+            nombres[rutas[0]] = nombre
+            continue
+        raiz = os.path.commonpath([os.path.dirname(ruta) for ruta in rutas])
+        relativos = {ruta: os.path.normpath(os.path.join(os.path.relpath(os.path.dirname(ruta), raiz), nombre)) for ruta in rutas}
+        for ruta in rutas:
+            relativo = relativos[ruta]
+            if list(relativos.values()).count(relativo) > 1:
+                relativo += os.path.splitext(ruta)[1].lower()
+            nombres[ruta] = relativo
+
+    usados = set()
+    for ruta in archivos:
+        nombre, contador = nombres[ruta], 2
+        while nombres[ruta] in usados:
+            nombres[ruta] = f"{nombre} ({contador})"
+            contador += 1
+        usados.add(nombres[ruta])
+    return nombres
+
+def informe_temporada(archivos, num_workers=None, cache=None, status=None):
+    # cache: ruta del JSON de recuentos (None = leer siempre todos los episodios).
+    # Devuelve (informe, episodios): takes por personaje en cada episodio con su total, y
+    # una fila por episodio con su suma de takes y si se leyó o venía del JSON.
+    archivos = sorted({os.path.abspath(ruta) for ruta in archivos}, key=lambda ruta: clave_natural(nombre_episodio(ruta)))
+    recuentos = leer_recuentos(cache) if cache else {}
+    # Olvidar los episodios que ya no existen
+    recuentos = {ruta: guardado for ruta, guardado in recuentos.items() if os.path.exists(ruta)}
+
+    pendientes = []
+    for ruta in archivos:
+        estado = os.stat(ruta)
+        firma = [estado.st_size, estado.st_mtime_ns]
+        if recuentos.get(ruta, {}).get('firma') != firma:
+            recuentos[ruta] = {'firma': firma, 'takes': None}
+            pendientes.append(ruta)
+
+    if status:
+        status(f"Leyendo {len(pendientes)} de {len(archivos)} episodios...")
+    errores = {}
+    for hechos, (ruta, takes, error) in enumerate(recuentos_en_paralelo(pendientes, num_workers), start=1):
+        if error is not None:
+            logging.error(f"Error al leer '{ruta}': {error}")
+            errores[ruta] = f"{type(error).__name__}: {error}"
+            del recuentos[ruta]
+        else:
+            recuentos[ruta]['takes'] = takes
+        if status:
+            status(f"Episodios leídos: {hechos}/{len(pendientes)}")
+    if cache:
+        guardar_recuentos(cache, recuentos)
+
+    nombres = nombres_episodios(archivos)
+    takes_por_personaje = {}
+    episodios = []
+    for ruta in archivos:
+        fila = {'EPISODIO': nombres[ruta], 'ARCHIVO': ruta}
+        if ruta in errores:
+            episodios.append({**fila, 'PERSONAJES': 0, 'SUMA_TOTAL_TAKES': 0, 'ORIGEN': 'error', 'ERROR': errores[ruta]})
+            continue
+        takes = recuentos[ruta]['takes']
+        for personaje, total in takes.items():
+            takes_por_personaje.setdefault(personaje, {})[nombres[ruta]] = total
+        episodios.append({**fila, 'PERSONAJES': len(takes), 'SUMA_TOTAL_TAKES': sum(takes.values()),
+                          'ORIGEN': 'archivo' if ruta in pendientes else 'cache', 'ERROR': None})
+
+    columnas = [nombres[ruta] for ruta in archivos if ruta not in errores]
+    informe = pd.DataFrame.from_dict(takes_por_personaje, orient='index', columns=columnas).fillna(0).astype('int64')
+    informe['TOTAL_TAKES'] = informe[columnas].sum(axis=1)
+    informe['EPISODIOS'] = (informe[columnas] > 0).sum(axis=1)
+    informe.index.name = 'PERSONAJE'
+    informe = informe.sort_index().reset_index()
+    total = {'PERSONAJE': 'Suma total de Takes:', **{c: int(informe[c].sum()) for c in columnas + ['TOTAL_TAKES']},
+             'EPISODIOS': len(columnas)}
+    informe = pd.concat([informe, pd.DataFrame([total])], ignore_index=True)
+    return informe, pd.DataFrame(episodios)
+
+# 11. Procesar archivo
+# cancelar (threading.Event, opcional) detiene la optimización entre escenas; al_terminar se
+# llama en el hilo de Tk cuando el procesamiento acaba, con éxito, con error o cancelado.
+def procesar_archivo(sesion, selected_personajes, status_label, window, process_button, cancelar=None, al_terminar=None):
+    try:
+        procesar_y_exportar(sesion, selected_personajes, status_label, window, process_button, cancelar)
+    finally:
+        if al_terminar is not None:
+            window.after(0, al_terminar)
 
-# 10. Procesar archivo
-def procesar_archivo(file_path, selected_personajes, status_label, window, process_button):
+def procesar_y_exportar(sesion, selected_personajes, status_label, window, process_button, cancelar=None):
     def update_status(text):
         window.after(0, lambda: status_label.config(text=text))
 
@@ -353,101 +1632,240 @@ def procesar_archivo(file_path, selected_personajes, status_label, window, proce
     def enable_process_button():
         window.after(0, lambda: process_button.config(state=tk.NORMAL))
 
-    df = leer_archivo(file_path)
-    if df is None:
+    # El guion ya se leyó al abrir la ventana de personajes
+    df = sesion.df
+    metricas = Metricas()
+    metricas.registrar_etapa('lectura', sesion.segundos_lectura, len(df), memoria_df(df))
+    try:
+        validar_columnas(df)
+    except ValueError as e:
+        show_error("Error", str(e))
         enable_process_button()
         return
 
-    columnas_necesarias = {'IN', 'OUT', 'PERSONAJE', 'DIÁLOGO', 'SCENE'}
-    columnas_faltantes = columnas_necesarias - set(df.columns)
-    if columnas_faltantes:
-        show_error("Error", f"Faltan las siguientes columnas: {', '.join(columnas_faltantes)}")
+    try:
+        df_prop_optimizada, takes_por_personaje_optimizada, suma_total_takes_optimizada = generar_takeo(
+            df, selected_personajes, num_workers=NUM_WORKERS, status=update_status, metricas=metricas, cache=abrir_cache_escenas(),
+            cancelar=cancelar)
+    except ProcesoCancelado:
+        update_status("Procesamiento cancelado")
+        enable_process_button()
+        return
+    except Exception as e:
+        logging.error(f"Error al optimizar los takes: {e}")
+        show_error("Error", f"Error al optimizar los takes: {e}")
+        update_status("Error")
         enable_process_button()
         return
 
-    # Filtrar los personajes seleccionados
-    df = df[df['PERSONAJE'].isin(selected_personajes)].reset_index(drop=True)
-
-    update_status("Convirtiendo tiempos...")
-    df['in_td'] = df['IN'].apply(time_to_timedelta)
-    df['out_td'] = df['OUT'].apply(time_to_timedelta)
-    df['duracion'] = (df['out_td'] - df['in_td']).dt.total_seconds()
-    df = df.sort_values(by=['in_td', 'out_td']).reset_index(drop=True)
-
-    update_status("Dividiendo diálogos largos...")
-    df = expandir_dialogos(df)
-
-    update_status("Limpiando texto...")
-    df['DIÁLOGO'] = df['DIÁLOGO'].apply(clean_text)
-    df['PERSONAJE'] = df['PERSONAJE'].apply(clean_text)
-
-    update_status("Asignando *takes* optimizados...")
-    df_prop_optimizada = asignar_takes_optimizado(df)
-
-    df_prop_optimizada['DURACIÓN'] = df_prop_optimizada['DURACIÓN'].astype(float)
+    # Si se canceló justo al terminar la optimización, tampoco se exporta
+    if cancelar is not None and cancelar.is_set():
+        update_status("Procesamiento cancelado")
+        enable_process_button()
+        return
 
-    update_status("Calculando resumen de *takes* por personaje...")
-    takes_por_personaje_optimizada, suma_total_takes_optimizada = calcular_total_takes_por_personaje(df_prop_optimizada)
+    # Crear nombres de archivos de salida a partir del archivo de entrada
+    output_excel, output_txt = rutas_salida(sesion.file_path)
 
-    # Obtener el nombre base del archivo de entrada
-    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    update_status(f"Exportando a Excel '{output_excel}' y TXT '{output_txt}'...")
+    futuro_excel, futuro_txt = exportar_salidas(
+        df_prop_optimizada, takes_por_personaje_optimizada, suma_total_takes_optimizada, output_excel, output_txt, metricas,
+        status=update_status)
 
-    # Crear nombres de archivos de salida
-    output_excel = f"{base_name}_TAKEO.xlsx"
-    output_txt = f"{base_name}_DIALOG.txt"
-
-    update_status(f"Exportando a Excel '{output_excel}'...")
     try:
-        with pd.ExcelWriter(output_excel, engine='xlsxwriter') as writer:
-            df_prop_optimizada.to_excel(writer, sheet_name='Optimizada_Takes', index=False)
-            takes_por_personaje_optimizada.to_excel(writer, sheet_name='Resumen', index=False)
-            workbook  = writer.book
-            worksheet = writer.sheets['Resumen']
-            last_row = len(takes_por_personaje_optimizada) + 1
-            worksheet.write(f'A{last_row + 1}', 'Suma total de Takes:')
-            worksheet.write(f'B{last_row + 1}', suma_total_takes_optimizada)
-        update_status(f"Exportación a Excel completada: '{output_excel}'")
+        futuro_excel.result()
     except Exception as e:
         logging.error(f"Error al exportar a Excel: {e}")
         show_error("Error", f"Error al exportar a Excel: {e}")
         enable_process_button()
         return
 
-    # Transformar Excel a TXT
-    update_status(f"Transformando Excel a TXT '{output_txt}'...")
     try:
-        transformar_excel_a_txt(output_excel, output_txt)
-        update_status(f"Exportación a TXT completada: '{output_txt}'")
-        show_info("Éxito", f"La propuesta optimizada y su resumen han sido exportados a '{output_excel}'\nEl archivo de diálogo ha sido generado: '{output_txt}'")
+        futuro_txt.result()
     except Exception as e:
-        logging.error(f"Error al transformar Excel a TXT: {e}")
-        show_error("Error", f"Error al transformar Excel a TXT: {e}")
+        logging.error(f"Error al generar el TXT: {e}")
+        show_error("Error", f"Error al generar el TXT: {e}")
         enable_process_button()
         return
 
+    output_metricas = ruta_metricas(output_excel)
+    try:
+        metricas.guardar_json(output_metricas)
+    except Exception as e:
+        logging.error(f"Error al guardar las métricas: {e}")
+
+    update_status(metricas.resumen_texto())
+    show_info("Éxito", f"La propuesta optimizada y su resumen han sido exportados a '{output_excel}'\nEl archivo de diálogo ha sido generado: '{output_txt}'\nMétricas: '{output_metricas}'")
+
     enable_process_button()
 
-# 11. Seleccionar archivo y mostrar ventana de personajes
+# 12. Seleccionar archivo y mostrar ventana de personajes
 def seleccionar_archivo(entry_label):
     file_path = filedialog.askopenfilename(
         title="Seleccionar archivo Excel",
-        filetypes=(("Archivos Excel", "*.xlsx *.xls"), ("Todos los archivos", "*.*"))
+        filetypes=(("Archivos Excel", "*.xlsx *.xls"), ("Tablas CSV, Parquet o Feather", "*.csv *.parquet *.feather *.arrow"),
+                   ("Todos los archivos", "*.*"))
     )
-    if file_path:
-        entry_label.config(text=file_path)
-        crear_ventana_personajes(file_path)
-
-# 12. Crear ventana para seleccionar personajes
-def crear_ventana_personajes(file_path):
-    df = leer_archivo(file_path)
-    if df is None:
+    if not file_path:
         return
 
-    if 'PERSONAJE' not in df.columns:
+    entry_label.config(text=f"Cargando '{file_path}'...")
+
+    # Leer el guion fuera del hilo de Tk para que la interfaz no se congele
+    def cargar():
+        try:
+            cargar_dependencias()  # Espera a la precarga si todavía no ha terminado
+            sesion = GuionCargado.cargar(file_path)
+        except FileNotFoundError:
+            entry_label.after(0, lambda: messagebox.showerror("Error", f"El archivo '{file_path}' no se encontró."))
+            return
+        except ImportError as e:
+            mensaje = str(e)
+            logging.error(mensaje)
+            entry_label.after(0, lambda: messagebox.showerror("Error", mensaje))
+            return
+        except Exception as e:
+            mensaje = f"Error al leer el archivo Excel: {e}"
+            logging.error(mensaje)
+            entry_label.after(0, lambda: messagebox.showerror("Error", mensaje))
+            return
+        finally:
+            entry_label.after(0, lambda: entry_label.config(text=file_path))
+        entry_label.after(0, lambda: crear_ventana_personajes(sesion))
+
+    threading.Thread(target=cargar, daemon=True).start()
+
+# 13. Crear ventana para seleccionar personajes
+class IndicePersonajes:
+    # Búsqueda por subcadena sin distinguir mayúsculas, con los nombres en minúsculas
+    # calculados una sola vez. Se guardan los resultados de cada búsqueda: al seguir
+    # escribiendo solo se filtran los candidatos de la búsqueda anterior. Los nombres que
+    # empiezan por el texto buscado se muestran primero.
+    MAX_BUSQUEDAS = 256
+
+    def __init__(self, personajes):
+        self.personajes = list(personajes)
+        self.claves = [str(personaje).lower() for personaje in self.personajes]
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.resultados = {'': list(range(len(self.personajes)))}
+
+    def buscar(self, texto):
+        texto = texto.lower()
+        if texto not in self.resultados:
+            if len(self.resultados) > self.MAX_BUSQUEDAS:
+                self.reiniciar()
+            # Partir de la búsqueda guardada más larga que sea prefijo del texto
+            previo = max((t for t in self.resultados if texto.startswith(t)), key=len)
+            self.resultados[texto] = [i for i in self.resultados[previo] if texto in self.claves[i]]
+        indices = self.resultados[texto]
+        if texto:
+            indices = sorted(indices, key=lambda i: not self.claves[i].startswith(texto))
+        return [self.personajes[i] for i in indices]
+
+class ListaPersonajes:
+    # Lista de casillas virtual: solo existen las casillas de las filas visibles, y al
+    # desplazarse o filtrar se reasignan los personajes a esas mismas casillas. La selección
+    # se guarda aparte, en un diccionario por personaje.
+    def __init__(self, master, personajes, textos=None, filas=FILAS_LISTA_PERSONAJES, al_cambiar=None):
+        self.personajes = list(personajes)
+        self.textos = textos or {personaje: personaje for personaje in self.personajes}
+        self.seleccion = dict.fromkeys(self.personajes, True)
+        self.visibles = self.personajes
+        self.inicio = 0
+        self.al_cambiar = al_cambiar
+
+        self.frame = tk.Frame(master)
+        filas_frame = tk.Frame(self.frame)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.desplazar)
+        filas_frame.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.variables = []
+        self.casillas = []
+        for fila in range(filas):
+            var = tk.BooleanVar(value=False)
+            casilla = tk.Checkbutton(filas_frame, variable=var, anchor='w', width=40,
+                                     command=lambda fila=fila: self.alternar(fila))
+            casilla.grid(row=fila, column=0, sticky='w')
+            self.variables.append(var)
+            self.casillas.append(casilla)
+
+        # Rueda del ratón: <MouseWheel> en Windows y macOS, botones 4 y 5 en Linux
+        for widget in [filas_frame, *self.casillas]:
+            for evento in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+                widget.bind(evento, self.rueda)
+        self.dibujar()
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def dibujar(self):
+        for fila, (var, casilla) in enumerate(zip(self.variables, self.casillas)):
+            indice = self.inicio + fila
+            if indice < len(self.visibles):
+                personaje = self.visibles[indice]
+                casilla.config(text=self.textos[personaje])
+                var.set(self.seleccion[personaje])
+                casilla.grid()
+            else:
+                casilla.grid_remove()
+        total = len(self.visibles)
+        if total:
+            self.scrollbar.set(self.inicio / total, min(1.0, (self.inicio + len(self.casillas)) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def mostrar_desde(self, inicio):
+        inicio = max(0, min(inicio, len(self.visibles) - len(self.casillas)))
+        if inicio != self.inicio:
+            self.inicio = inicio
+            self.dibujar()
+
+    def desplazar(self, accion, cantidad, unidad=None):
+        # Protocolo del comando de la scrollbar: ('moveto', fracción) o ('scroll', n, 'units'/'pages')
+        if accion == 'moveto':
+            self.mostrar_desde(round(float(cantidad) * len(self.visibles)))
+        else:
+            paso = len(self.casillas) if unidad == 'pages' else 1
+            self.mostrar_desde(self.inicio + int(cantidad) * paso)
+
+    def rueda(self, event):
+        hacia_arriba = event.num == 4 or getattr(event, 'delta', 0) > 0
+        self.mostrar_desde(self.inicio + (-3 if hacia_arriba else 3))
+        return "break"
+
+    def alternar(self, fila):
+        personaje = self.visibles[self.inicio + fila]
+        self.seleccion[personaje] = self.variables[fila].get()
+        if self.al_cambiar:
+            self.al_cambiar()
+
+    def filtrar(self, visibles):
+        self.visibles = visibles
+        self.inicio = 0
+        self.dibujar()
+
+    def marcar_todos(self, valor):
+        for personaje in self.seleccion:
+            self.seleccion[personaje] = valor
+        self.dibujar()
+        if self.al_cambiar:
+            self.al_cambiar()
+
+    def seleccionados(self):
+        return [personaje for personaje in self.personajes if self.seleccion[personaje]]
+
+def texto_personaje(personaje, lineas):
+    return f"{personaje} ({lineas} {'línea' if lineas == 1 else 'líneas'})"
+
+def crear_ventana_personajes(sesion):
+    if 'PERSONAJE' not in sesion.df.columns:
         messagebox.showerror("Error", "El archivo no contiene la columna 'PERSONAJE'")
         return
 
-    personajes = sorted(df['PERSONAJE'].dropna().unique())
+    personajes = sesion.personajes
 
     # Crear ventana nueva
     window = tk.Toplevel()
@@ -455,13 +1873,17 @@ def crear_ventana_personajes(file_path):
 
     # Variable para controlar si el procesamiento está en curso
     processing = [False]  # Usamos una lista para que sea mutable
+    processing_cancel = [None]  # Evento para cancelar el procesamiento en curso
+    close_when_done = [False]  # Cerrar la ventana en cuanto termine la cancelación
 
     # Función para manejar el cierre de la ventana
     def on_closing():
         if processing[0]:
-            messagebox.showwarning("Advertencia", "El procesamiento está en curso, por favor espera a que termine.")
+            if messagebox.askyesno("Advertencia", "El procesamiento está en curso. ¿Cancelarlo y cerrar la ventana?"):
+                close_when_done[0] = True
+                cancelar_procesamiento()
         else:
-            window.destroy()
+            cerrar_ventana()
 
     window.protocol("WM_DELETE_WINDOW", on_closing)
 
@@ -486,67 +1908,91 @@ def crear_ventana_personajes(file_path):
     deselect_all_button = ttk.Button(button_frame, text="Deseleccionar Todos")
     deselect_all_button.pack(side=tk.LEFT, padx=5)
 
-    # Marco para checkboxes
-    checkbox_frame = tk.Frame(window)
-    checkbox_frame.pack()
+    # Previsualización del total de takes: se recalcula en segundo plano al cambiar la
+    # selección, esperando a que el usuario deje de marcar casillas y descartando los
+    # cálculos que se hayan quedado anticuados
+    previsualizacion = PrevisualizacionTakes(sesion.df, cache=abrir_cache_escenas())
+    preview_label = tk.Label(window, text="Takes estimados: calculando...")
+    preview_job = [None]  # after() pendiente
+    preview_cancel = [None]  # Evento del cálculo en curso
+
+    def cancelar_previsualizacion():
+        if preview_job[0] is not None:
+            window.after_cancel(preview_job[0])
+            preview_job[0] = None
+        if preview_cancel[0] is not None:
+            preview_cancel[0].set()
+
+    def calcular_previsualizacion(selected_personajes, cancelar):
+        try:
+            _, suma_total_takes = previsualizacion.calcular(selected_personajes, cancelar)
+            text = f"Takes estimados: {suma_total_takes} ({len(selected_personajes)} personajes)"
+        except ProcesoCancelado:
+            return
+        except Exception as e:
+            logging.error(f"Error en la previsualización de takes: {e}")
+            text = "Takes estimados: no disponible"
+        if not cancelar.is_set():
+            window.after(0, lambda: preview_label.config(text=text))
+
+    def lanzar_previsualizacion():
+        preview_job[0] = None
+        selected_personajes = lista.seleccionados()
+        if not selected_personajes:
+            preview_label.config(text="Takes estimados: 0")
+            return
+        preview_label.config(text="Takes estimados: calculando...")
+        preview_cancel[0] = threading.Event()
+        threading.Thread(target=calcular_previsualizacion, args=(selected_personajes, preview_cancel[0]), daemon=True).start()
 
-    # Añadir un canvas y un scrollbar
-    canvas = tk.Canvas(checkbox_frame)
-    scrollbar = ttk.Scrollbar(checkbox_frame, orient="vertical", command=canvas.yview)
-    scrollable_frame = tk.Frame(canvas)
+    def programar_previsualizacion(*args):
+        cancelar_previsualizacion()
+        preview_job[0] = window.after(RETARDO_PREVISUALIZACION_MS, lanzar_previsualizacion)
 
-    scrollable_frame.bind(
-        "<Configure>",
-        lambda e: canvas.configure(
-            scrollregion=canvas.bbox("all")
-        )
-    )
+    # Lista de personajes con su número de líneas; solo se crean las casillas visibles
+    textos = {p: texto_personaje(p, sesion.lineas_por_personaje.get(p, 0)) for p in personajes}
+    lista = ListaPersonajes(window, personajes, textos, al_cambiar=programar_previsualizacion)
+    lista.pack()
 
-    canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-    canvas.configure(yscrollcommand=scrollbar.set)
+    # Filtrar según la búsqueda, esperando a que el usuario deje de escribir
+    indice = IndicePersonajes(personajes)
+    search_job = [None]  # after() pendiente
 
-    canvas.pack(side="left", fill="both", expand=True)
-    scrollbar.pack(side="right", fill="y")
+    def update_checkboxes():
+        search_job[0] = None
+        lista.filtrar(indice.buscar(search_var.get()))
 
-    # Variables y widgets de checkboxes
-    checkbox_vars = {}
-    checkbox_widgets = {}
+    def programar_busqueda(*args):
+        if search_job[0] is not None:
+            window.after_cancel(search_job[0])
+        search_job[0] = window.after(RETARDO_BUSQUEDA_MS, update_checkboxes)
 
-    # Función para actualizar checkboxes según búsqueda
-    def update_checkboxes(*args):
-        search_text = search_var.get().lower()
-        for personaje, var in checkbox_vars.items():
-            if search_text in personaje.lower():
-                checkbox_widgets[personaje].pack(anchor='w')
-            else:
-                checkbox_widgets[personaje].pack_forget()
+    search_var.trace_add('write', programar_busqueda)
 
-    search_var.trace('w', update_checkboxes)
+    # Al cerrar se descartan la búsqueda y la previsualización pendientes
+    def cerrar_ventana():
+        if search_job[0] is not None:
+            window.after_cancel(search_job[0])
+            search_job[0] = None
+        cancelar_previsualizacion()
+        window.destroy()
 
-    # Crear checkboxes para cada personaje
-    for personaje in personajes:
-        var = tk.BooleanVar(value=True)
-        checkbox = tk.Checkbutton(scrollable_frame, text=personaje, variable=var)
-        checkbox.pack(anchor='w')
-        checkbox_vars[personaje] = var
-        checkbox_widgets[personaje] = checkbox
+    # Seleccionar o deseleccionar todos (también los ocultos por la búsqueda)
+    select_all_button.config(command=lambda: lista.marcar_todos(True))
+    deselect_all_button.config(command=lambda: lista.marcar_todos(False))
 
-    # Función para seleccionar todos
-    def select_all():
-        for var in checkbox_vars.values():
-            var.set(True)
+    preview_label.pack(pady=(5, 0))
+    programar_previsualizacion()
 
-    # Función para deseleccionar todos
-    def deselect_all():
-        for var in checkbox_vars.values():
-            var.set(False)
+    # Botones para iniciar y cancelar el procesamiento
+    action_frame = tk.Frame(window)
+    action_frame.pack(pady=10)
 
-    select_all_button.config(command=select_all)
-    deselect_all_button.config(command=deselect_all)
+    process_button = ttk.Button(action_frame, text="Iniciar Procesamiento")
+    process_button.pack(side=tk.LEFT, padx=5)
 
-    # Botón para iniciar procesamiento
-    process_button = ttk.Button(window, text="Iniciar Procesamiento")
-    process_button.pack(pady=10)
+    cancel_button = ttk.Button(action_frame, text="Cancelar", state=tk.DISABLED)
+    cancel_button.pack(side=tk.LEFT, padx=5)
 
     # Etiqueta de estado
     status_label = tk.Label(window, text="Esperando...", fg="green")
@@ -554,22 +2000,46 @@ def crear_ventana_personajes(file_path):
 
     # Función para iniciar procesamiento
     def iniciar():
-        selected_personajes = [p for p, var in checkbox_vars.items() if var.get()]
+        selected_personajes = lista.seleccionados()
         if not selected_personajes:
             messagebox.showwarning("Advertencia", "Debe seleccionar al menos un personaje para procesar.")
             return
 
         # Deshabilitar el botón y marcar que el procesamiento está en curso
         process_button.config(state=tk.DISABLED)
+        cancel_button.config(state=tk.NORMAL)
         processing[0] = True
+        processing_cancel[0] = threading.Event()
 
         # Iniciar procesamiento
-        threading.Thread(target=procesar_archivo, args=(file_path, selected_personajes, status_label, window, process_button), daemon=True).start()
+        threading.Thread(target=procesar_archivo, args=(sesion, selected_personajes, status_label, window, process_button),
+                         kwargs={'cancelar': processing_cancel[0], 'al_terminar': terminado}, daemon=True).start()
+
+    # Se llama en el hilo de Tk al acabar el procesamiento, de cualquier forma
+    def terminado():
+        processing[0] = False
+        processing_cancel[0] = None
+        cancel_button.config(state=tk.DISABLED)
+        if close_when_done[0]:
+            cerrar_ventana()
+
+    def cancelar_procesamiento():
+        if processing_cancel[0] is not None:
+            processing_cancel[0].set()
+            cancel_button.config(state=tk.DISABLED)
+            status_label.config(text="Cancelando...")
 
     process_button.config(command=iniciar)
+    cancel_button.config(command=cancelar_procesamiento)
 
-# 13. Crear interfaz gráfica principal
-def crear_interfaz():
+# Fin de la carga del módulo (sin pandas ni numpy, que se cargan después)
+FIN_CARGA_MODULO = time.perf_counter()
+
+# 14. Crear interfaz gráfica principal
+# Con medir_arranque (ruta de un JSON) se anotan los segundos hasta que la ventana es
+# visible y hasta que terminan de cargarse las dependencias, y luego se cierra la ventana
+def crear_interfaz(medir_arranque=None):
+    tiempos_arranque['modulo'] = round(FIN_CARGA_MODULO - INICIO_ARRANQUE, 4)
     root = tk.Tk()
     root.title("Optimización de Takes")
 
@@ -585,8 +2055,27 @@ def crear_interfaz():
     select_button = ttk.Button(frame, text="Seleccionar Archivo Excel", command=lambda: seleccionar_archivo(file_label), width=25)
     select_button.pack()
 
+    def ventana_visible():
+        tiempos_arranque['ventana'] = round(time.perf_counter() - INICIO_ARRANQUE, 4)
+        precargar_dependencias(al_terminar=arranque_completo)
+
+    def arranque_completo():
+        logging.info(f"Arranque: {tiempos_arranque}")
+        if medir_arranque is not None:
+            with open(medir_arranque, 'w', encoding='utf-8') as archivo:
+                json.dump(tiempos_arranque, archivo, indent=2)
+            root.after(0, root.destroy)
+
+    # La precarga empieza cuando la ventana ya se ha dibujado
+    root.after_idle(lambda: root.after(0, ventana_visible))
     root.mainloop()
 
 # Ejecutar la interfaz gráfica
 if __name__ == "__main__":
-    crear_interfaz()
+    multiprocessing.freeze_support()  # Necesario para el pool de procesos en el ejecutable
+    # Takeo --medir-arranque [ruta.json]: mide el arranque y se cierra
+    medir_arranque = None
+    if '--medir-arranque' in sys.argv:
+        posicion = sys.argv.index('--medir-arranque')
+        medir_arranque = sys.argv[posicion + 1] if posicion + 1 < len(sys.argv) else 'Takeo_arranque.json'
+    crear_interfaz(medir_arranque)
@@ -6,11 +6,14 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    # pandas, numpy y los motores de Excel se importan de forma diferida en Takeo.py.
+    # pyarrow (Parquet y Feather) se deja fuera: en un único ejecutable se extraería en cada
+    # arranque. Takeo avisa si se elige uno de esos archivos; Takeo_rapido.spec sí lo incluye.
+    hiddenimports=['pandas', 'numpy', 'openpyxl', 'xlsxwriter'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['pyarrow'],
     noarchive=False,
     optimize=0,
 )
@@ -0,0 +1,54 @@
+# -*- mode: python ; coding: utf-8 -*-
+# Perfil de arranque rápido: carpeta (one-dir) en lugar de un único ejecutable, para no
+# extraer todo a un directorio temporal en cada arranque, sin UPX (descomprimir las DLL
+# también cuesta) y sin los paquetes opcionales de pandas que Takeo no usa.
+# pyinstaller Takeo_rapido.spec  ->  dist/Takeo/Takeo.exe
+
+
+a = Analysis(
+    ['Takeo.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    # pandas, numpy y los motores de Excel se importan de forma diferida en Takeo.py;
+    # pyarrow lo carga pandas al leer o escribir Parquet y Feather
+    hiddenimports=['pandas', 'numpy', 'openpyxl', 'xlsxwriter', 'pyarrow'],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=[
+        'matplotlib', 'scipy', 'IPython', 'jupyter', 'notebook', 'pytest', 'numba',
+        'sqlalchemy', 'psycopg2', 'tables', 'bs4', 'lxml', 'html5lib', 'jinja2',
+        'PyQt5', 'PyQt6', 'PySide2', 'PySide6', 'pydoc_data', 'lib2to3',
+    ],
+    noarchive=False,
+    optimize=0,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='Takeo',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=False,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='Takeo',
+)
@@ -0,0 +1,41 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Mide el arranque en frío de Takeo (script o ejecutable empaquetado) con --medir-arranque.
+# El tiempo total incluye lo que Takeo no puede medir por sí mismo: el arranque del
+# intérprete y, en el ejecutable de un solo archivo, la extracción del paquete.
+def medir_arranque(comando):
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'arranque.json')
+        inicio = time.perf_counter()
+        subprocess.run([*comando, '--medir-arranque', ruta], check=True)
+        total = time.perf_counter() - inicio
+        with open(ruta, encoding='utf-8') as archivo:
+            tiempos = json.load(archivo)
+    tiempos['proceso'] = round(total, 4)
+    return tiempos
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo de arranque de la interfaz de Takeo.")
+    parser.add_argument('ejecutable', nargs='?', default=None,
+                        help="Ejecutable empaquetado (por defecto, Takeo.py con este intérprete).")
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    comando = [args.ejecutable] if args.ejecutable else [sys.executable, os.path.join(RAIZ, 'Takeo.py')]
+    mediciones = [medir_arranque(comando) for _ in range(args.repeticiones)]
+    for clave in ('modulo', 'ventana', 'dependencias', 'proceso'):
+        valores = sorted(m[clave] for m in mediciones if clave in m)
+        if valores:
+            print(f"{clave:>13}: mediana {valores[len(valores) // 2]:.3f} s, mínimo {valores[0]:.3f} s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Takeo
+from guion_sintetico import generar_guion_sintetico
+
+RESULTADOS_POR_DEFECTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resultados.jsonl')
+
+# 1. Ejecutar el pipeline completo registrando cada etapa en un objeto Takeo.Metricas
+def ejecutar_etapas(ruta_guion, directorio_salida, num_workers=1):
+    metricas = Takeo.Metricas()
+    with metricas.etapa('lectura') as etapa:
+        df = Takeo.leer_guion(ruta_guion)
+        etapa['filas'] = len(df)
+        etapa['bytes_df'] = Takeo.memoria_df(df)
+
+    df_takes, takes_por_personaje, suma_total_takes = Takeo.generar_takeo(
+        df, num_workers=num_workers, status=lambda texto: None, metricas=metricas)
+
+    # Las exportaciones se miden una tras otra (en la aplicación van en paralelo)
+    # para que el pico de memoria de cada una no se mezcle con el de la otra
+    output_excel, output_txt = Takeo.rutas_salida(ruta_guion, directorio_salida)
+    with metricas.etapa('exportar_excel') as etapa:
+        Takeo.exportar_excel(df_takes, takes_por_personaje, suma_total_takes, output_excel)
+        etapa['filas'] = len(df_takes)
+    with metricas.etapa('exportar_txt') as etapa:
+        Takeo.generar_dialogo_txt(df_takes, Takeo.nombre_dialogo(output_excel), output_txt)
+        etapa['filas'] = len(df_takes)
+    return metricas, df_takes
+
+# 2. Medir tiempos (mejor de N repeticiones) y memoria pico por etapa
+def medir_guion(ruta_guion, repeticiones=3, num_workers=1):
+    tiempos = {}
+    with tempfile.TemporaryDirectory() as directorio_salida:
+        for _ in range(repeticiones):
+            gc.collect()
+            metricas, df_takes = ejecutar_etapas(ruta_guion, directorio_salida, num_workers)
+            for nombre, datos in metricas.etapas.items():
+                tiempos[nombre] = min(tiempos.get(nombre, float('inf')), datos['segundos'])
+
+        # La memoria se mide en una pasada aparte porque tracemalloc ralentiza la ejecución;
+        # con tracemalloc activo Metricas.etapa anota el pico de cada etapa
+        gc.collect()
+        tracemalloc.start()
+        try:
+            metricas_memoria, _ = ejecutar_etapas(ruta_guion, directorio_salida, 1)
+        finally:
+            tracemalloc.stop()
+
+    etapas = {nombre: {'segundos': tiempos[nombre],
+                       'pico_bytes': metricas_memoria.etapas[nombre]['pico_bytes'],
+                       'bytes_df': datos.get('bytes_df'),
+                       'filas': datos['filas']} for nombre, datos in metricas.etapas.items()}
+    return etapas, int(df_takes['TAKE'].nunique()), metricas.a_dict()['escenas_mas_lentas']
+
+# 3. Guardar resultados y comparar con la ejecución anterior con los mismos parámetros
+def version_git():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except Exception:
+        return None
+
+def ultima_ejecucion(ruta_resultados, parametros):
+    if not os.path.exists(ruta_resultados):
+        return None
+    anterior = None
+    with open(ruta_resultados, encoding='utf-8') as archivo:
+        for linea in archivo:
+            registro = json.loads(linea)
+            if registro['parametros'] == parametros:
+                anterior = registro
+    return anterior
+
+def comparar(etapas, anterior, umbral):
+    # Devuelve las etapas más lentas que en la ejecución anterior por encima del umbral relativo
+    regresiones = []
+    for nombre, datos in etapas.items():
+        previo = anterior['etapas'].get(nombre) if anterior else None
+        if previo and previo['segundos'] > 0:
+            cambio = datos['segundos'] / previo['segundos'] - 1
+            datos['cambio'] = round(cambio, 4)
+            if cambio > umbral:
+                regresiones.append(nombre)
+    return regresiones
+
+def imprimir_tabla(etapas, regresiones):
+    print(f"{'ETAPA':<20}{'SEGUNDOS':>12}{'PICO (MB)':>12}{'DF (MB)':>10}{'FILAS':>10}{'CAMBIO':>10}")
+    for nombre, datos in etapas.items():
+        cambio = f"{datos['cambio']:+.1%}" if 'cambio' in datos else '-'
+        marca = '  <-- más lenta' if nombre in regresiones else ''
+        filas = datos['filas'] if datos['filas'] is not None else '-'
+        memoria_df = f"{datos['bytes_df'] / 2**20:.2f}" if datos.get('bytes_df') is not None else '-'
+        print(f"{nombre:<20}{datos['segundos']:>12.4f}{datos['pico_bytes'] / 2**20:>12.2f}{memoria_df:>10}{filas:>10}{cambio:>10}{marca}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark por etapas del takeo sobre un guion sintético.")
+    parser.add_argument('--escenas', type=int, default=50)
+    parser.add_argument('--lineas-por-escena', type=int, default=40)
+    parser.add_argument('--reparto', type=int, default=15, help="Número de personajes distintos.")
+    parser.add_argument('--solapamiento', type=float, default=0.15, help="Probabilidad de bloques de grupo con el mismo IN/OUT.")
+    parser.add_argument('--palabras-min', type=int, default=1)
+    parser.add_argument('--palabras-max', type=int, default=30)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=1, help="Procesos para la optimización de escenas.")
+    parser.add_argument('--resultados', default=RESULTADOS_POR_DEFECTO, help="Archivo JSONL donde se acumulan las ejecuciones.")
+    parser.add_argument('--umbral', type=float, default=0.2, help="Aumento relativo de tiempo considerado regresión.")
+    parser.add_argument('--fallar-si-regresion', action='store_true', help="Salir con código 1 si alguna etapa es más lenta.")
+    args = parser.parse_args(argv)
+
+    parametros = {
+        'escenas': args.escenas, 'lineas_por_escena': args.lineas_por_escena, 'reparto': args.reparto,
+        'solapamiento': args.solapamiento, 'palabras_min': args.palabras_min, 'palabras_max': args.palabras_max,
+        'semilla': args.semilla, 'workers': args.workers,
+    }
+    df = generar_guion_sintetico(args.escenas, args.lineas_por_escena, args.reparto, args.solapamiento,
+                                 args.palabras_min, args.palabras_max, semilla=args.semilla)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta_guion = os.path.join(directorio, 'BENCH.xlsx')
+        df.to_excel(ruta_guion, index=False)
+        etapas, takes, escenas_mas_lentas = medir_guion(ruta_guion, args.repeticiones, args.workers)
+
+    anterior = ultima_ejecucion(args.resultados, parametros)
+    regresiones = comparar(etapas, anterior, args.umbral)
+
+    registro = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': version_git(),
+        'python': platform.python_version(),
+        'parametros': parametros,
+        'filas_guion': len(df),
+        'takes': takes,
+        'total_segundos': round(sum(d['segundos'] for d in etapas.values()), 6),
+        'etapas': etapas,
+        'escenas_mas_lentas': escenas_mas_lentas,
+    }
+    with open(args.resultados, 'a', encoding='utf-8') as archivo:
+        # Los valores de NumPy (p. ej. el número de escena) se guardan como números de Python
+        archivo.write(json.dumps(registro, ensure_ascii=False, default=Takeo.valor_json) + '\n')
+
+    print(f"Guion sintético: {len(df)} filas, {takes} takes")
+    imprimir_tabla(etapas, regresiones)
+    if regresiones:
+        print(f"Etapas más lentas que la ejecución anterior (> {args.umbral:.0%}): {', '.join(regresiones)}")
+        if args.fallar_si_regresion:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
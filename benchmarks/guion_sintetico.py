@@ -0,0 +1,45 @@
+import random
+
+import pandas as pd
+
+# Palabras y acotaciones con las que se construyen los diálogos sintéticos
+PALABRAS = ("patruila loroa salbatu kaixo lagunok arranoa harpia espero maskota hurbiltzea "
+            "gehiegi ikusi makusi tukanak txakur etorri azkar laguntza behar dugu ondo").split()
+ACOTACIONES = ['(off)', '(on)', '(ad lib)', '(batera ad lib)', '(risas)']
+
+def formatear_timecode(frames, fps=24):
+    segundos, ff = divmod(frames, fps)
+    minutos, ss = divmod(segundos, 60)
+    hh, mm = divmod(minutos, 60)
+    return f"{hh:02d}:{mm:02d}:{ss:02d}:{ff:02d}"
+
+def generar_guion_sintetico(escenas=50, lineas_por_escena=40, reparto=15, solapamiento=0.15,
+                            palabras_min=1, palabras_max=30, prob_acotacion=0.3, fps=24, semilla=0):
+    # Genera un guion con las columnas de entrada (IN, OUT, PERSONAJE, DIÁLOGO, SCENE).
+    # solapamiento es la probabilidad de que una intervención sea un bloque de varios
+    # personajes con el mismo IN/OUT (p. ej. un "(batera ad lib)" de grupo).
+    rng = random.Random(semilla)
+    personajes = [f"PERSONAJE_{i:03d}" for i in range(1, reparto + 1)]
+    filas = []
+    frame = 10 * fps
+    for escena in range(1, escenas + 1):
+        frame += rng.randint(2, 10) * fps
+        for _ in range(lineas_por_escena):
+            duracion = rng.randint(fps // 2, 8 * fps)
+            tc_in, tc_out = formatear_timecode(frame, fps), formatear_timecode(frame + duracion, fps)
+
+            if rng.random() < solapamiento:
+                grupo = rng.sample(personajes, min(len(personajes), rng.randint(2, 6)))
+                for personaje in grupo:
+                    filas.append({'IN': tc_in, 'OUT': tc_out, 'PERSONAJE': personaje,
+                                  'DIÁLOGO': '(batera ad lib)', 'SCENE': escena})
+            else:
+                palabras = [rng.choice(PALABRAS) for _ in range(rng.randint(palabras_min, palabras_max))]
+                if rng.random() < prob_acotacion:
+                    palabras.insert(rng.randrange(len(palabras) + 1), rng.choice(ACOTACIONES))
+                filas.append({'IN': tc_in, 'OUT': tc_out, 'PERSONAJE': rng.choice(personajes),
+                              'DIÁLOGO': ' '.join(palabras).capitalize(), 'SCENE': escena})
+
+            # Las intervenciones a veces se pisan con la anterior
+            frame += max(1, duracion - rng.randint(0, fps))
+    return pd.DataFrame(filas, columns=['IN', 'OUT', 'PERSONAJE', 'DIÁLOGO', 'SCENE'])
@@ -0,0 +1,431 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import Takeo
+import takeo_servicio
+from Excel_to_Dialog import buscar_takeos
+
+# Extensiones de guion aceptadas al recorrer un directorio
+EXTENSIONES_GUION = tuple(Takeo.FORMATOS_TABLA)
+
+# --excel-streaming -> argumento excel_streaming de Takeo.procesar_episodio
+MODOS_EXCEL_STREAMING = {'auto': None, 'si': True, 'no': False}
+
+# 1. Buscar los guiones a procesar en un directorio o patrón glob
+def es_guion(ruta):
+    nombre = os.path.basename(ruta)
+    # Ignorar salidas de ejecuciones anteriores y archivos temporales de Excel
+    if nombre.startswith('~$') or os.path.splitext(nombre)[0].upper().endswith(('_TAKEO', '_TAKEO_RESUMEN')):
+        return False
+    return os.path.isfile(ruta) and nombre.lower().endswith(EXTENSIONES_GUION)
+
+def buscar_guiones(entradas):
+    return Takeo.buscar_archivos(entradas, es_guion)
+
+def abrir_cache(opciones):
+    # Cada proceso abre su propia conexión; SQLite se encarga de serializar las escrituras
+    if opciones['cache'] is None:
+        return None
+    return Takeo.CacheEscenas(opciones['cache'], max_bytes=opciones['cache_max_mb'] * 2**20)
+
+# 2. Procesar un episodio dentro del pool (nunca lanza excepciones)
+def procesar_en_lote(file_path, opciones):
+    inicio = time.perf_counter()
+    output_dir = opciones['output_dir'] or os.path.dirname(file_path)
+    try:
+        resumen = Takeo.procesar_episodio(
+            file_path,
+            selected_personajes=opciones['personajes'],
+            excluded_personajes=opciones['excluir'],
+            output_dir=output_dir,
+            status=lambda text: logging.debug(f"{os.path.basename(file_path)}: {text}"),
+            frame_rate=opciones['frame_rate'],
+            max_caracteres=opciones['max_caracteres'],
+            formato_salida=opciones['formato'],
+            excel_streaming=opciones['excel_streaming'],
+            cache=abrir_cache(opciones),
+            **opciones['limites'],
+        )
+        resumen['estado'] = 'ok'
+    except Exception as e:
+        logging.error(f"Error al procesar '{file_path}': {e}")
+        resumen = {'archivo': file_path, 'estado': 'error', 'error': f"{type(e).__name__}: {e}"}
+    resumen['segundos'] = round(time.perf_counter() - inicio, 3)
+    return resumen
+
+# 3. Procesar todos los episodios con un pool de procesos
+def procesar_lote(archivos, opciones, num_workers=None):
+    def informar(file_path, resumen, hechos):
+        logging.info(f"[{hechos}/{len(archivos)}] {resumen['estado']}: {file_path}")
+    return Takeo.mapear_en_procesos(procesar_en_lote, archivos, opciones, num_workers=num_workers, al_terminar=informar)
+
+# 4. Vigilar una carpeta de entregas
+def hash_archivo(ruta):
+    resumen = hashlib.blake2b(digest_size=20)
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(2**20), b''):
+            resumen.update(bloque)
+    return resumen.hexdigest()
+
+def firma_opciones(opciones):
+    # Resumen de las opciones que cambian las salidas (la caché solo cambia el tiempo)
+    relevantes = {clave: valor for clave, valor in opciones.items() if clave not in ('cache', 'cache_max_mb')}
+    return hashlib.blake2b(json.dumps(relevantes, sort_keys=True, default=str).encode('utf-8'), digest_size=10).hexdigest()
+
+class VigilanteCarpeta:
+    # Revisa la carpeta periódicamente (sin dependencias externas) y envía al pool los guiones
+    # nuevos o modificados. Un archivo se procesa cuando su tamaño y fecha no cambian durante
+    # 'espera' segundos, es decir, cuando ha terminado de copiarse. El registro guarda por ruta
+    # el hash del contenido y las opciones del último takeo; no se repite si ninguno cambia y
+    # sus salidas siguen en disco (un guion que falló no se reintenta hasta que cambie).
+    def __init__(self, carpeta, opciones, executor, espera=5.0, registro=None):
+        self.carpeta = os.path.abspath(carpeta)
+        self.opciones = opciones
+        self.firma_opciones = firma_opciones(opciones)
+        self.executor = executor
+        self.espera = espera
+        self.registro = registro or os.path.join(self.carpeta, '.takeo_procesados.json')
+        self.procesados = self.leer_registro()  # ruta -> resumen del último procesado
+        self.observados = {}  # ruta -> (tamaño y fecha, desde cuándo no cambian, ya revisado)
+        self.en_curso = {}  # futuro -> (ruta, hash)
+
+    def leer_registro(self):
+        if not os.path.exists(self.registro):
+            return {}
+        with open(self.registro, encoding='utf-8') as archivo:
+            procesados = json.load(archivo)
+        # Las entradas de un registro de otra versión (sin hash) se ignoran
+        return {ruta: datos for ruta, datos in procesados.items() if isinstance(datos, dict) and 'hash' in datos}
+
+    def guardar_registro(self):
+        Takeo.guardar_json_atomico(self.registro, self.procesados, indent=2)
+
+    def ya_procesado(self, ruta, contenido):
+        anterior = self.procesados.get(ruta)
+        if anterior is None or anterior['hash'] != contenido or anterior.get('opciones') != self.firma_opciones:
+            return False
+        return anterior['estado'] != 'ok' or all(os.path.exists(salida) for salida in anterior.get('salidas', []))
+
+    def revisar(self, ahora=None):
+        if ahora is None:
+            ahora = time.monotonic()
+        rutas_en_curso = {ruta for ruta, _ in self.en_curso.values()}
+        actuales = set()
+        for nombre in os.listdir(self.carpeta):
+            ruta = os.path.join(self.carpeta, nombre)
+            if not es_guion(ruta):
+                continue
+            try:
+                estado = os.stat(ruta)
+            except FileNotFoundError:
+                continue
+            actuales.add(ruta)
+            firma = (estado.st_size, estado.st_mtime_ns)
+            anterior = self.observados.get(ruta)
+            if anterior is None or anterior[0] != firma:
+                self.observados[ruta] = (firma, ahora, False)
+                continue
+            _, desde, revisado = anterior
+            if revisado or ruta in rutas_en_curso or ahora - desde < self.espera:
+                continue
+
+            try:
+                contenido = hash_archivo(ruta)
+            except OSError:
+                # Todavía bloqueado por quien lo copia: volver a esperar
+                self.observados[ruta] = (firma, ahora, False)
+                continue
+            self.observados[ruta] = (firma, desde, True)
+            if self.ya_procesado(ruta, contenido):
+                logging.info(f"Sin cambios desde el último takeo ({self.procesados[ruta]['estado']}): {ruta}")
+                continue
+            logging.info(f"Nuevo guion: {ruta}")
+            self.en_curso[self.executor.submit(procesar_en_lote, ruta, self.opciones)] = (ruta, contenido)
+
+        # Olvidar los archivos que ya no están en la carpeta
+        for ruta in set(self.observados) - actuales:
+            del self.observados[ruta]
+
+    def recoger(self):
+        terminados = [futuro for futuro in self.en_curso if futuro.done()]
+        for futuro in terminados:
+            ruta, contenido = self.en_curso.pop(futuro)
+            resumen = futuro.result()
+            self.procesados[ruta] = {
+                'hash': contenido,
+                'opciones': self.firma_opciones,
+                'estado': resumen['estado'],
+                'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'segundos': resumen['segundos'],
+                'suma_total_takes': resumen.get('suma_total_takes'),
+                'salidas': [resumen[clave] for clave in ('excel', 'txt') if resumen.get(clave)],
+                'error': resumen.get('error'),
+            }
+            logging.info(f"{resumen['estado']}: {ruta} ({resumen['segundos']:.2f} s)")
+        if terminados:
+            self.guardar_registro()
+        return len(terminados)
+
+def leer_lista_personajes(valor):
+    if valor is None:
+        return None
+    return [p.strip() for p in valor.split(',') if p.strip()]
+
+def lista_de(tipo):
+    # '25,30' -> [25, 30] para los argumentos de la rejilla del barrido
+    def convertir(valor):
+        try:
+            return [tipo(v) for v in valor.split(',') if v.strip()]
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Se esperaba una lista separada por comas: '{valor}'")
+    return convertir
+
+def añadir_opciones_episodio(parser):
+    # Opciones del takeo de cada episodio, comunes a 'lote' y 'vigilar'
+    parser.add_argument('--salida', dest='output_dir', default=None, help="Directorio de salida (por defecto, junto a cada guion).")
+    parser.add_argument('--personajes', default=None, help="Lista de personajes a incluir separados por comas (por defecto, todos).")
+    parser.add_argument('--excluir', default=None, help="Lista de personajes a excluir separados por comas.")
+    parser.add_argument('--formato', choices=Takeo.FORMATOS_SALIDA, default='xlsx',
+                        help="Formato de los takes: xlsx para revisar a mano; csv, parquet o feather para lotes (más rápidos).")
+    parser.add_argument('--excel-streaming', choices=sorted(MODOS_EXCEL_STREAMING), default='auto',
+                        help="Escribir el Excel en modo de memoria constante (auto: a partir de "
+                             f"{Takeo.UMBRAL_FILAS_EXCEL_STREAMING} filas).")
+    parser.add_argument('--fps', dest='frame_rate', choices=sorted(Takeo.FRECUENCIAS), default=Takeo.FRAME_RATE, help="Frecuencia de los códigos de tiempo.")
+    parser.add_argument('--max-caracteres', type=int, default=60, help="Caracteres máximos por línea (sin contar paréntesis) antes de dividirla.")
+    parser.add_argument('--max-duracion-take', type=float, default=30, help="Duración máxima de un take en segundos.")
+    parser.add_argument('--max-lineas-take', type=int, default=10, help="Líneas máximas por take.")
+    parser.add_argument('--max-lineas-consecutivas', type=int, default=5, help="Líneas consecutivas máximas de un personaje.")
+    parser.add_argument('--max-lineas-por-personaje', type=int, default=5, help="Líneas máximas de un personaje en un take.")
+    parser.add_argument('--motor', choices=Takeo.MOTORES, default='auto', help="Motor del optimizador (auto usa el voraz solo en escenas que superan los límites).")
+    parser.add_argument('--limite-bloques', type=int, default=20000, help="Con --motor auto, bloques a partir de los cuales se usa el motor voraz.")
+    parser.add_argument('--limite-segundos', type=float, default=30, help="Con --motor auto, segundos del motor exacto por escena antes de pasar al voraz.")
+    parser.add_argument('--cache', default=None, help="Archivo de la caché de escenas ya optimizadas (por defecto, la del usuario).")
+    parser.add_argument('--sin-cache', action='store_true', help="Optimizar todas las escenas sin consultar ni guardar la caché.")
+    parser.add_argument('--cache-max-mb', type=int, default=64, help="Tamaño máximo de la caché de escenas en MB.")
+
+def opciones_episodio(args):
+    limites = {
+        'max_duracion_take': args.max_duracion_take,
+        'max_lineas_take': args.max_lineas_take,
+        'max_lineas_consecutivas': args.max_lineas_consecutivas,
+        'max_lineas_por_personaje': args.max_lineas_por_personaje,
+        'motor': args.motor,
+        'limite_bloques': args.limite_bloques,
+        'limite_segundos': args.limite_segundos,
+    }
+    return {
+        'output_dir': args.output_dir,
+        'personajes': leer_lista_personajes(args.personajes),
+        'excluir': leer_lista_personajes(args.excluir),
+        'limites': limites,
+        'frame_rate': args.frame_rate,
+        'max_caracteres': args.max_caracteres,
+        'formato': args.formato,
+        'excel_streaming': MODOS_EXCEL_STREAMING[args.excel_streaming],
+        'cache': None if args.sin_cache else (args.cache or Takeo.ruta_cache_por_defecto()),
+        'cache_max_mb': args.cache_max_mb,
+    }
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Takeo de guiones sin interfaz gráfica.")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    lote = subparsers.add_parser('lote', help="Procesar en paralelo todos los guiones de un directorio o patrón glob.")
+    lote.add_argument('entradas', nargs='+', help="Directorios o patrones glob (p. ej. 'temporada2/*.xlsx').")
+    lote.add_argument('--workers', type=int, default=None, help="Episodios procesados a la vez (por defecto, todos los núcleos).")
+    lote.add_argument('--resumen', default='takeo_lote.json', help="Ruta del resumen JSON de la ejecución.")
+    añadir_opciones_episodio(lote)
+
+    barrido = subparsers.add_parser('barrido', help="Comparar los takes por personaje de un guion con varias combinaciones de límites.")
+    barrido.add_argument('guion', help="Guion a evaluar (Excel, CSV, Parquet o Feather).")
+    barrido.add_argument('--salida', default='takeo_barrido.xlsx',
+                         help="Tabla comparativa: .xlsx (hojas Comparacion y Configuraciones) o .csv/.parquet/.feather (dos archivos).")
+    barrido.add_argument('--personajes', default=None, help="Lista de personajes a incluir separados por comas (por defecto, todos).")
+    barrido.add_argument('--excluir', default=None, help="Lista de personajes a excluir separados por comas.")
+    barrido.add_argument('--workers', type=int, default=None, help="Procesos para optimizar las escenas (por defecto, todos los núcleos).")
+    barrido.add_argument('--fps', dest='frame_rate', choices=sorted(Takeo.FRECUENCIAS), default=Takeo.FRAME_RATE, help="Frecuencia de los códigos de tiempo.")
+    barrido.add_argument('--max-caracteres', type=int, default=60, help="Caracteres máximos por línea (sin contar paréntesis) antes de dividirla.")
+    barrido.add_argument('--max-duracion-take', type=lista_de(float), default=[30], help="Duraciones máximas de take a probar, p. ej. 25,30.")
+    barrido.add_argument('--max-lineas-take', type=lista_de(int), default=[10], help="Líneas máximas por take a probar, p. ej. 8,10,12.")
+    barrido.add_argument('--max-lineas-consecutivas', type=lista_de(int), default=[5], help="Líneas consecutivas máximas a probar.")
+    barrido.add_argument('--max-lineas-por-personaje', type=lista_de(int), default=[5], help="Líneas máximas de un personaje por take a probar.")
+    barrido.add_argument('--motor', choices=Takeo.MOTORES, default='auto', help="Motor del optimizador.")
+    barrido.add_argument('--cache', default=None, help="Archivo de la caché de escenas (por defecto, la del usuario).")
+    barrido.add_argument('--sin-cache', action='store_true', help="No consultar ni guardar la caché de escenas.")
+
+    temporada = subparsers.add_parser('temporada', help="Informe de takes por personaje de todos los episodios ya exportados.")
+    temporada.add_argument('entradas', nargs='+', help="Archivos _TAKEO, directorios (se buscan *_TAKEO.xlsx, .csv, .parquet...) o patrones glob.")
+    temporada.add_argument('--salida', default='TEMPORADA_TAKES.xlsx', help="Archivo del informe (.xlsx, .csv, .parquet o .feather).")
+    temporada.add_argument('--workers', type=int, default=None, help="Episodios leídos a la vez (por defecto, todos los núcleos).")
+    temporada.add_argument('--cache', default=None, help="JSON con los recuentos de cada episodio (por defecto, junto a la caché de escenas).")
+    temporada.add_argument('--sin-cache', action='store_true', help="Leer siempre todos los episodios.")
+
+    servicio = subparsers.add_parser('servicio', help="Servicio residente con cola de trabajos por HTTP local.")
+    servicio.add_argument('--host', default=takeo_servicio.HOST_SERVICIO, help="Dirección de escucha (por defecto, solo este equipo).")
+    servicio.add_argument('--puerto', type=int, default=takeo_servicio.PUERTO_SERVICIO, help="Puerto HTTP.")
+    servicio.add_argument('--concurrentes', type=int, default=2, help="Trabajos procesados a la vez; el resto espera en la cola.")
+    servicio.add_argument('--workers', type=int, default=1, help="Procesos para optimizar las escenas de cada trabajo.")
+    servicio.add_argument('--max-guiones', type=int, default=8, help="Guiones leídos que se mantienen en memoria.")
+    servicio.add_argument('--cache', default=None, help="Archivo de la caché de escenas (por defecto, la del usuario).")
+    servicio.add_argument('--sin-cache', action='store_true', help="No consultar ni guardar la caché de escenas.")
+    servicio.add_argument('--cache-max-mb', type=int, default=64, help="Tamaño máximo de la caché de escenas en MB.")
+
+    vigilar = subparsers.add_parser('vigilar', help="Takeo automático de los guiones que se copien a una carpeta.")
+    vigilar.add_argument('carpeta', help="Carpeta de entregas a vigilar.")
+    vigilar.add_argument('--workers', type=int, default=None, help="Guiones procesados a la vez (por defecto, todos los núcleos).")
+    vigilar.add_argument('--espera', type=float, default=5.0, help="Segundos sin cambios para dar por terminada la copia de un archivo.")
+    vigilar.add_argument('--intervalo', type=float, default=2.0, help="Segundos entre revisiones de la carpeta.")
+    vigilar.add_argument('--registro', default=None, help="Registro JSON con la ruta, el hash y las opciones de cada guion procesado (por defecto, .takeo_procesados.json en la carpeta).")
+    añadir_opciones_episodio(vigilar)
+    return parser
+
+def comando_vigilar(args):
+    if not os.path.isdir(args.carpeta):
+        logging.error(f"No existe la carpeta '{args.carpeta}'.")
+        return 1
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    opciones = opciones_episodio(args)
+
+    with ProcessPoolExecutor(max_workers=args.workers or os.cpu_count() or 1) as executor:
+        vigilante = VigilanteCarpeta(args.carpeta, opciones, executor, args.espera, args.registro)
+        logging.info(f"Vigilando '{vigilante.carpeta}' (Ctrl+C para terminar)")
+        try:
+            while True:
+                vigilante.revisar()
+                vigilante.recoger()
+                time.sleep(args.intervalo)
+        except KeyboardInterrupt:
+            logging.info("Esperando a los guiones en curso...")
+        for futuro in list(vigilante.en_curso):
+            futuro.result()
+        vigilante.recoger()
+    return 0
+
+def comando_servicio(args):
+    cache = None
+    if not args.sin_cache:
+        cache = Takeo.CacheEscenas(args.cache, max_bytes=args.cache_max_mb * 2**20)
+    Takeo.cargar_dependencias()  # El servicio arranca ya caliente
+    servicio = takeo_servicio.ServicioTakeo(args.concurrentes, args.workers, cache, args.max_guiones)
+    servidor = takeo_servicio.crear_servidor(servicio, args.host, args.puerto)
+    logging.info(f"Servicio de takeo en {takeo_servicio.url_servicio(args.host, args.puerto)} "
+                 f"({args.concurrentes} trabajos a la vez)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return 0
+
+def comando_barrido(args):
+    df = Takeo.leer_guion(args.guion)
+    Takeo.validar_columnas(df)
+
+    personajes = leer_lista_personajes(args.personajes)
+    excluidos = leer_lista_personajes(args.excluir)
+    if excluidos:
+        candidatos = personajes if personajes is not None else df['PERSONAJE'].dropna().unique()
+        personajes = [p for p in candidatos if p not in set(excluidos)]
+
+    rejilla = {
+        'max_duracion_take': args.max_duracion_take,
+        'max_lineas_take': args.max_lineas_take,
+        'max_lineas_consecutivas': args.max_lineas_consecutivas,
+        'max_lineas_por_personaje': args.max_lineas_por_personaje,
+    }
+    cache = None if args.sin_cache else Takeo.CacheEscenas(args.cache)
+
+    inicio = time.perf_counter()
+    comparacion, configuraciones = Takeo.barrido_limites(
+        df, rejilla, personajes, num_workers=args.workers, frame_rate=args.frame_rate,
+        max_caracteres=args.max_caracteres, cache=cache, motor=args.motor)
+
+    if Takeo.formato_tabla(args.salida) == 'excel':
+        with Takeo.pd.ExcelWriter(args.salida, engine='xlsxwriter') as writer:
+            comparacion.to_excel(writer, sheet_name='Comparacion', index=False)
+            configuraciones.to_excel(writer, sheet_name='Configuraciones', index=False)
+    else:
+        base, extension = os.path.splitext(args.salida)
+        Takeo.escribir_tabla(comparacion, args.salida)
+        Takeo.escribir_tabla(configuraciones, f"{base}_CONFIGURACIONES{extension}")
+
+    mejor = configuraciones.loc[configuraciones['SUMA_TOTAL_TAKES'].idxmin()]
+    logging.info(f"{len(configuraciones)} combinaciones en {time.perf_counter() - inicio:.2f} s. "
+                 f"Menos takes: {mejor['CONFIGURACION']} ({mejor['SUMA_TOTAL_TAKES']}). Tabla en '{args.salida}'")
+    return 0
+
+def comando_temporada(args):
+    archivos = buscar_takeos(args.entradas)
+    if not archivos:
+        logging.error("No se encontraron archivos de takes.")
+        return 1
+    cache = None if args.sin_cache else (args.cache or Takeo.ruta_recuentos_por_defecto())
+
+    inicio = time.perf_counter()
+    informe, episodios = Takeo.informe_temporada(archivos, num_workers=args.workers, cache=cache, status=logging.debug)
+
+    if Takeo.formato_tabla(args.salida) == 'excel':
+        with Takeo.pd.ExcelWriter(args.salida, engine='xlsxwriter') as writer:
+            informe.to_excel(writer, sheet_name='Temporada', index=False)
+            episodios.to_excel(writer, sheet_name='Episodios', index=False)
+    else:
+        base, extension = os.path.splitext(args.salida)
+        Takeo.escribir_tabla(informe, args.salida)
+        Takeo.escribir_tabla(episodios, f"{base}_EPISODIOS{extension}")
+
+    errores = int((episodios['ORIGEN'] == 'error').sum())
+    leidos = int((episodios['ORIGEN'] == 'archivo').sum())
+    logging.info(f"{len(episodios) - errores}/{len(episodios)} episodios ({leidos} leídos, el resto de la caché) en "
+                 f"{time.perf_counter() - inicio:.2f} s: {informe['TOTAL_TAKES'].iloc[-1]} takes. Informe en '{args.salida}'")
+    return 1 if errores else 0
+
+def comando_lote(args):
+    archivos = buscar_guiones(args.entradas)
+    if not archivos:
+        logging.error("No se encontraron guiones para procesar.")
+        return 1
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    opciones = opciones_episodio(args)
+
+    inicio = time.perf_counter()
+    episodios = procesar_lote(archivos, opciones, args.workers)
+    errores = sum(1 for e in episodios if e['estado'] != 'ok')
+
+    resumen = {
+        'parametros': {**opciones, 'workers': args.workers},
+        'episodios': episodios,
+        'total_episodios': len(episodios),
+        'errores': errores,
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }
+    with open(args.resumen, 'w', encoding='utf-8') as archivo_resumen:
+        json.dump(resumen, archivo_resumen, ensure_ascii=False, indent=2)
+
+    logging.info(f"{len(episodios) - errores}/{len(episodios)} episodios procesados. Resumen en '{args.resumen}'")
+    return 1 if errores else 0
+
+COMANDOS = {
+    'lote': comando_lote,
+    'barrido': comando_barrido,
+    'temporada': comando_temporada,
+    'servicio': comando_servicio,
+    'vigilar': comando_vigilar,
+}
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    return COMANDOS[args.comando](args)
+
+if __name__ == "__main__":
+    sys.exit(main())
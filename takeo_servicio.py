@@ -0,0 +1,322 @@
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import Takeo
+
+# Servicio residente de takeo: un proceso con pandas ya importado, las cachés calientes y
+# una cola de trabajos atendida por un número fijo de hilos. Se usa por HTTP en local:
+#   POST   /trabajos          {"archivo": "...", "personajes": [...], "limites": {...}} -> {"id": ...}
+#   GET    /trabajos          lista de trabajos (sin los resultados)
+#   GET    /trabajos/<id>     estado, último mensaje de progreso y resultado o error
+#   DELETE /trabajos/<id>     cancela un trabajo en cola o en curso
+#   GET    /estado            cola, trabajos en curso y tamaño de las cachés
+
+HOST_SERVICIO = '127.0.0.1'
+PUERTO_SERVICIO = 8765
+
+# Parámetros del optimizador que se aceptan en "limites"
+LIMITES_ADMITIDOS = {'max_duracion_take', 'max_lineas_take', 'max_lineas_consecutivas', 'max_lineas_por_personaje',
+                     'motor', 'limite_bloques', 'limite_segundos'}
+
+ESTADOS_FINALES = ('terminado', 'error', 'cancelado')
+
+def es_numero(valor):
+    # bool es un int en Python, pero true/false no son límites válidos
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+def validar_lista_personajes(peticion, campo):
+    valor = peticion.get(campo)
+    if valor is not None and (not isinstance(valor, list) or not all(isinstance(p, str) for p in valor)):
+        raise ValueError(f"'{campo}' debe ser una lista de nombres: {valor!r}")
+    return valor
+
+# 1. Guiones leídos recientemente (LRU acotada), para no volver a parsear el libro cuando
+# se reenvía un episodio con otra selección de personajes
+class CacheGuiones:
+    def __init__(self, max_entradas=8):
+        self.max_entradas = max_entradas
+        self.entradas = OrderedDict()
+        self.lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, ruta):
+        # La clave incluye tamaño y fecha de modificación: un archivo cambiado se vuelve a leer
+        estado = os.stat(ruta)
+        clave = (os.path.abspath(ruta), estado.st_size, estado.st_mtime_ns)
+        with self.lock:
+            if clave in self.entradas:
+                self.entradas.move_to_end(clave)
+                self.aciertos += 1
+                return self.entradas[clave]
+            self.fallos += 1
+        df = Takeo.leer_guion(ruta)
+        with self.lock:
+            self.entradas[clave] = df
+            while len(self.entradas) > self.max_entradas:
+                self.entradas.popitem(last=False)
+        return df
+
+    def a_dict(self):
+        with self.lock:
+            return {'entradas': len(self.entradas), 'max_entradas': self.max_entradas,
+                    'aciertos': self.aciertos, 'fallos': self.fallos}
+
+# 2. Cola de trabajos con concurrencia acotada
+class ServicioTakeo:
+    def __init__(self, max_concurrentes=2, num_workers=1, cache_escenas=None, max_guiones=8, max_historial=200):
+        self.num_workers = num_workers
+        self.cache_escenas = cache_escenas
+        self.guiones = CacheGuiones(max_guiones)
+        self.max_historial = max_historial
+        self.trabajos = OrderedDict()
+        self.cancelaciones = {}
+        self.cola = queue.Queue()
+        self.lock = threading.Lock()
+        self.contador = itertools.count(1)
+        self.hilos = [threading.Thread(target=self.atender, daemon=True, name=f"takeo-{i}") for i in range(max_concurrentes)]
+        for hilo in self.hilos:
+            hilo.start()
+
+    def enviar(self, peticion):
+        # Valida la petición y la encola; devuelve la vista pública del trabajo
+        archivo = peticion.get('archivo')
+        if not archivo or not os.path.isfile(archivo):
+            raise ValueError(f"No existe el archivo: {archivo!r}")
+        limites = peticion.get('limites') or {}
+        desconocidos = set(limites) - LIMITES_ADMITIDOS
+        if desconocidos:
+            raise ValueError(f"Límites desconocidos: {', '.join(sorted(desconocidos))}")
+        for nombre, valor in limites.items():
+            # limite_segundos=null desactiva el plazo del motor exacto
+            if nombre == 'motor' or (nombre == 'limite_segundos' and valor is None):
+                continue
+            if not es_numero(valor) or valor < 0:
+                raise ValueError(f"El límite '{nombre}' debe ser un número no negativo: {valor!r}")
+        formato = peticion.get('formato', 'xlsx')
+        if formato not in Takeo.FORMATOS_SALIDA:
+            raise ValueError(f"Formato no admitido: {formato!r}")
+        # Se acepta la frecuencia como número o como texto ("24", 23.976)
+        frame_rate = str(peticion.get('fps', Takeo.FRAME_RATE))
+        if frame_rate not in Takeo.FRECUENCIAS:
+            raise ValueError(f"Frecuencia no admitida: {frame_rate!r}")
+        if limites.get('motor', 'auto') not in Takeo.MOTORES:
+            raise ValueError(f"Motor no admitido: {limites['motor']!r}")
+        personajes = validar_lista_personajes(peticion, 'personajes')
+        excluir = validar_lista_personajes(peticion, 'excluir')
+        max_caracteres = peticion.get('max_caracteres', 60)
+        if not isinstance(max_caracteres, int) or isinstance(max_caracteres, bool) or max_caracteres <= 0:
+            raise ValueError(f"'max_caracteres' debe ser un entero positivo: {max_caracteres!r}")
+
+        trabajo = {
+            'id': f"{next(self.contador):06d}",
+            'archivo': os.path.abspath(archivo),
+            'opciones': {
+                'personajes': personajes,
+                'excluir': excluir,
+                'output_dir': peticion.get('output_dir') or os.path.dirname(os.path.abspath(archivo)),
+                'formato': formato,
+                'frame_rate': frame_rate,
+                'max_caracteres': max_caracteres,
+                'limites': limites,
+            },
+            'estado': 'en_cola',
+            'mensaje': None,
+            'creado': time.time(),
+            'inicio': None,
+            'fin': None,
+            'resultado': None,
+            'error': None,
+        }
+        with self.lock:
+            self.trabajos[trabajo['id']] = trabajo
+            self.cancelaciones[trabajo['id']] = threading.Event()
+            self.recortar_historial()
+        self.cola.put(trabajo['id'])
+        logging.info(f"Trabajo {trabajo['id']} en cola: {trabajo['archivo']}")
+        return self.consultar(trabajo['id'])
+
+    def recortar_historial(self):
+        # Se olvidan los trabajos terminados más antiguos (nunca los pendientes)
+        terminados = [i for i, t in self.trabajos.items() if t['estado'] in ESTADOS_FINALES]
+        for id_trabajo in terminados[:max(0, len(self.trabajos) - self.max_historial)]:
+            del self.trabajos[id_trabajo]
+            self.cancelaciones.pop(id_trabajo, None)
+
+    def consultar(self, id_trabajo, con_resultado=True):
+        with self.lock:
+            trabajo = self.trabajos.get(id_trabajo)
+            if trabajo is None:
+                return None
+            vista = {clave: valor for clave, valor in trabajo.items() if con_resultado or clave != 'resultado'}
+            if trabajo['estado'] == 'en_cola':
+                vista['posicion'] = sum(1 for t in self.trabajos.values() if t['estado'] == 'en_cola' and t['creado'] <= trabajo['creado'])
+            return vista
+
+    def listar(self):
+        with self.lock:
+            ids = list(self.trabajos)
+        return [self.consultar(id_trabajo, con_resultado=False) for id_trabajo in ids]
+
+    def cancelar(self, id_trabajo):
+        with self.lock:
+            trabajo = self.trabajos.get(id_trabajo)
+            if trabajo is None:
+                return None
+            if trabajo['estado'] == 'en_cola':
+                trabajo['estado'] = 'cancelado'
+                trabajo['fin'] = time.time()
+            if trabajo['estado'] not in ESTADOS_FINALES:
+                self.cancelaciones[id_trabajo].set()
+        return self.consultar(id_trabajo)
+
+    def actualizar(self, id_trabajo, **cambios):
+        with self.lock:
+            self.trabajos[id_trabajo].update(cambios)
+
+    def atender(self):
+        while True:
+            id_trabajo = self.cola.get()
+            try:
+                with self.lock:
+                    trabajo = self.trabajos.get(id_trabajo)
+                    if trabajo is None or trabajo['estado'] != 'en_cola':
+                        continue
+                    trabajo['estado'] = 'procesando'
+                    trabajo['inicio'] = time.time()
+                    cancelar = self.cancelaciones[id_trabajo]
+                self.procesar(trabajo, cancelar)
+            finally:
+                self.cola.task_done()
+
+    def procesar(self, trabajo, cancelar):
+        id_trabajo = trabajo['id']
+        opciones = trabajo['opciones']
+        try:
+            # Como en los comandos lote y vigilar, el directorio de salida se crea si no existe
+            os.makedirs(opciones['output_dir'], exist_ok=True)
+            df = self.guiones.obtener(trabajo['archivo'])
+            resultado = Takeo.procesar_episodio(
+                trabajo['archivo'],
+                selected_personajes=opciones['personajes'],
+                excluded_personajes=opciones['excluir'],
+                output_dir=opciones['output_dir'],
+                num_workers=self.num_workers,
+                status=lambda texto: self.actualizar(id_trabajo, mensaje=texto),
+                formato_salida=opciones['formato'],
+                frame_rate=opciones['frame_rate'],
+                max_caracteres=opciones['max_caracteres'],
+                cache=self.cache_escenas,
+                cancelar=cancelar,
+                df=df,
+                **opciones['limites'],
+            )
+            self.actualizar(id_trabajo, estado='terminado', resultado=resultado, mensaje="Terminado", fin=time.time())
+            logging.info(f"Trabajo {id_trabajo} terminado: {resultado['suma_total_takes']} takes")
+        except Takeo.ProcesoCancelado:
+            self.actualizar(id_trabajo, estado='cancelado', mensaje="Cancelado", fin=time.time())
+            logging.info(f"Trabajo {id_trabajo} cancelado")
+        except Exception as e:
+            self.actualizar(id_trabajo, estado='error', error=f"{type(e).__name__}: {e}", fin=time.time())
+            logging.error(f"Error en el trabajo {id_trabajo}: {e}")
+
+    def estado(self):
+        with self.lock:
+            por_estado = {}
+            for trabajo in self.trabajos.values():
+                por_estado[trabajo['estado']] = por_estado.get(trabajo['estado'], 0) + 1
+        return {
+            'hilos': len(self.hilos),
+            'workers_por_trabajo': self.num_workers,
+            'trabajos': por_estado,
+            'cache_guiones': self.guiones.a_dict(),
+            'cache_escenas': self.cache_escenas.ruta if self.cache_escenas is not None else None,
+        }
+
+# 3. Interfaz HTTP (JSON)
+class ManejadorTakeo(BaseHTTPRequestHandler):
+    servicio = None  # Se asigna en crear_servidor
+
+    def responder(self, codigo, datos):
+        cuerpo = json.dumps(datos, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def ruta(self):
+        return [parte for parte in self.path.split('?')[0].split('/') if parte]
+
+    def do_GET(self):
+        partes = self.ruta()
+        if partes == ['estado']:
+            self.responder(200, self.servicio.estado())
+        elif partes == ['trabajos']:
+            self.responder(200, self.servicio.listar())
+        elif len(partes) == 2 and partes[0] == 'trabajos':
+            trabajo = self.servicio.consultar(partes[1])
+            if trabajo is None:
+                self.responder(404, {'error': "Trabajo no encontrado"})
+            else:
+                self.responder(200, trabajo)
+        else:
+            self.responder(404, {'error': "Ruta no encontrada"})
+
+    def do_POST(self):
+        if self.ruta() != ['trabajos']:
+            self.responder(404, {'error': "Ruta no encontrada"})
+            return
+        try:
+            longitud = int(self.headers.get('Content-Length', 0))
+            peticion = json.loads(self.rfile.read(longitud) or b'{}')
+            self.responder(202, self.servicio.enviar(peticion))
+        except (ValueError, TypeError, AttributeError) as e:
+            self.responder(400, {'error': str(e)})
+
+    def do_DELETE(self):
+        partes = self.ruta()
+        trabajo = self.servicio.cancelar(partes[1]) if len(partes) == 2 and partes[0] == 'trabajos' else None
+        if trabajo is None:
+            self.responder(404, {'error': "Trabajo no encontrado"})
+        else:
+            self.responder(200, trabajo)
+
+    def log_message(self, formato, *args):
+        logging.debug(f"{self.address_string()} {formato % args}")
+
+def crear_servidor(servicio, host=HOST_SERVICIO, puerto=PUERTO_SERVICIO):
+    manejador = type('ManejadorServicio', (ManejadorTakeo,), {'servicio': servicio})
+    return ThreadingHTTPServer((host, puerto), manejador)
+
+# 4. Cliente para scripts y otras herramientas
+def url_servicio(host=HOST_SERVICIO, puerto=PUERTO_SERVICIO):
+    return f"http://{host}:{puerto}"
+
+def peticion_servicio(metodo, ruta, datos=None, url=None):
+    cuerpo = json.dumps(datos).encode('utf-8') if datos is not None else None
+    peticion = urllib.request.Request(f"{url or url_servicio()}{ruta}", data=cuerpo, method=metodo,
+                                      headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(peticion) as respuesta:
+        return json.loads(respuesta.read().decode('utf-8'))
+
+def enviar_trabajo(archivo, url=None, **opciones):
+    return peticion_servicio('POST', '/trabajos', {'archivo': os.path.abspath(archivo), **opciones}, url)
+
+def consultar_trabajo(id_trabajo, url=None):
+    return peticion_servicio('GET', f'/trabajos/{id_trabajo}', url=url)
+
+def esperar_trabajo(id_trabajo, url=None, intervalo=0.5):
+    while True:
+        trabajo = consultar_trabajo(id_trabajo, url)
+        if trabajo['estado'] in ESTADOS_FINALES:
+            return trabajo
+        time.sleep(intervalo)
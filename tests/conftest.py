@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Los módulos del repositorio (y el generador de guiones de benchmarks/) se importan sin instalar
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, 'benchmarks'))
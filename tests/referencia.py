@@ -0,0 +1,190 @@
+import functools
+import logging
+import re
+from datetime import timedelta
+from itertools import groupby
+
+# Implementaciones originales (commit inicial) de las funciones reescritas, sin cambios.
+# Sirven de referencia en test_equivalencia.py: las versiones actuales deben dar los
+# mismos resultados.
+
+# 1. Función para convertir tiempo a timedelta
+@functools.lru_cache(maxsize=None)
+def time_to_timedelta(time_str):
+    try:
+        parts = time_str.split(':')
+        if len(parts) == 4:
+            hours, minutes, seconds, frames = map(int, parts)
+        elif len(parts) == 3:
+            hours, minutes, seconds = map(int, parts)
+            frames = 0
+        else:
+            raise ValueError("Formato de tiempo incorrecto")
+        total_seconds = hours * 3600 + minutes * 60 + seconds + frames / 24
+        return timedelta(seconds=total_seconds)
+    except Exception as e:
+        logging.error(f"Error al convertir tiempo: {time_str} - {e}")
+        return timedelta(0)
+
+# 2. Dividir diálogos que excedan los 60 caracteres (excluyendo contenido entre paréntesis)
+def dividir_dialogo(dialogo, max_caracteres=60):
+    dialogo_sin_parentesis = re.sub(r'\(.*?\)', '', dialogo)
+    if len(dialogo_sin_parentesis) <= max_caracteres:
+        return [dialogo]
+
+    palabras = dialogo.split()
+    lineas = []
+    linea_actual = ''
+    for palabra in palabras:
+        temp = f"{linea_actual} {palabra}".strip()
+        temp_sin_parentesis = re.sub(r'\(.*?\)', '', temp)
+        if len(temp_sin_parentesis) > max_caracteres:
+            if linea_actual:
+                lineas.append(linea_actual)
+            linea_actual = palabra
+        else:
+            linea_actual = temp
+    if linea_actual:
+        lineas.append(linea_actual)
+    return lineas
+
+# 5. Optimizar la división de *takes* en una escena considerando bloques con el mismo IN/OUT
+def optimizar_takes_escena(intervenciones_escena, max_duracion_take=30, max_lineas_take=10, max_lineas_consecutivas=5, max_lineas_por_personaje=5):
+    intervenciones = []
+    for idx, row in intervenciones_escena.iterrows():
+        intervenciones.append({
+            'idx': idx,
+            'in_td': row['in_td'],
+            'out_td': row['out_td'],
+            'duracion': row['duracion'],
+            'personaje': row['PERSONAJE'],
+            'dialogo': row['DIÁLOGO'],
+            'IN': row['IN'],
+            'OUT': row['OUT'],
+            'SCENE': row['SCENE']
+        })
+
+    if not intervenciones:
+        return []
+
+    # Ordenar las intervenciones
+    intervenciones_sorted = sorted(intervenciones, key=lambda x: (x['in_td'], x['out_td']))
+
+    # Agrupar las intervenciones por (in_td, out_td) para formar bloques indivisibles
+    bloques = []
+    for key, group in groupby(intervenciones_sorted, key=lambda x: (x['in_td'], x['out_td'])):
+        bloque = list(group)
+        bloques.append(bloque)
+
+    n = len(bloques)
+
+    @functools.lru_cache(maxsize=None)
+    def dp(pos):
+        # dp devuelve (best_takes, best_cost)
+        # best_cost = suma total mínima de takes por personaje desde pos al final
+        if pos >= n:
+            return [], 0
+
+        best_takes = None
+        best_cost = float('inf')
+
+        # Intentar formar un take con uno o varios bloques consecutivos
+        take_intervenciones = []
+        take_in = None
+        take_out = None
+
+        personaje_lineas_totales_take = {}
+        personaje_lineas_consecutivas_take = {}
+        ultimo_personaje = None
+        lineas_count = 0
+
+        for end in range(pos, n):
+            bloque = bloques[end]
+            # Intentar añadir este bloque completo al take
+            bloque_valido = True
+            bloque_lineas = 0
+            bloque_cambios = []
+            temp_personaje_lineas_totales = dict(personaje_lineas_totales_take)
+            temp_personaje_lineas_consecutivas = dict(personaje_lineas_consecutivas_take)
+            temp_ultimo_personaje = ultimo_personaje
+
+            for intervencion in bloque:
+                if take_in is None:
+                    take_in = intervencion['in_td']
+                take_out = intervencion['out_td']
+
+                personaje = intervencion['personaje']
+                bloque_lineas += 1
+
+                # Actualizar líneas totales por personaje
+                temp_personaje_lineas_totales[personaje] = temp_personaje_lineas_totales.get(personaje, 0) + 1
+                if temp_personaje_lineas_totales[personaje] > max_lineas_por_personaje:
+                    bloque_valido = False
+                    break
+
+                # Actualizar líneas consecutivas
+                if personaje != temp_ultimo_personaje:
+                    temp_personaje_lineas_consecutivas[personaje] = 1
+                else:
+                    temp_personaje_lineas_consecutivas[personaje] = temp_personaje_lineas_consecutivas.get(personaje, 0) + 1
+
+                if temp_personaje_lineas_consecutivas[personaje] > max_lineas_consecutivas:
+                    bloque_valido = False
+                    break
+
+                temp_ultimo_personaje = personaje
+
+            if not bloque_valido:
+                # No podemos añadir este bloque, romper el intento de expandir el take
+                break
+
+            # Si el bloque es válido, lo añadimos realmente
+            for intervencion in bloque:
+                take_intervenciones.append(intervencion)
+            personaje_lineas_totales_take = temp_personaje_lineas_totales
+            personaje_lineas_consecutivas_take = temp_personaje_lineas_consecutivas
+            ultimo_personaje = temp_ultimo_personaje
+            lineas_count += bloque_lineas
+
+            # Verificar duración y cantidad de líneas tras añadir este bloque
+            duracion_take = take_out - take_in
+            if duracion_take.total_seconds() > max_duracion_take:
+                break
+
+            if lineas_count > max_lineas_take:
+                break
+
+            # Si hemos llegado aquí, este take (pos -> end) es válido.
+            # Calcular el coste actual y decidir si cerramos el take aquí o intentamos añadir más bloques
+            personajes_en_take = set(i['personaje'] for i in take_intervenciones)
+            next_takes, next_cost = dp(end + 1)
+            current_cost = next_cost + len(personajes_en_take)
+
+            if current_cost < best_cost:
+                best_takes = [tuple(take_intervenciones)] + next_takes
+                best_cost = current_cost
+
+            # Intentar añadir el siguiente bloque en el mismo take
+            # Si el siguiente bloque no se puede añadir, el bucle se romperá en la siguiente iteración
+
+        if best_takes is None:
+            return [], float('inf')
+
+        return best_takes, best_cost
+
+    best_takes, _ = dp(0)
+
+    takes = []
+    take_id = 1
+    for take_intervenciones in best_takes:
+        take_intervenciones = list(take_intervenciones)
+        takes.append({
+            'take': take_id,
+            'in': take_intervenciones[0]['in_td'],
+            'out': take_intervenciones[-1]['out_td'],
+            'scene': take_intervenciones[0]['SCENE'],
+            'lineas': take_intervenciones
+        })
+        take_id += 1
+
+    return takes
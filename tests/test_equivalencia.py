@@ -0,0 +1,71 @@
+import random
+
+import pandas as pd
+import pytest
+
+import Takeo
+import referencia
+from guion_sintetico import formatear_timecode
+
+# Comprobación aleatoria de las reescrituras frente a las implementaciones originales:
+# mismos takes (las mismas filas en el mismo orden) y mismas líneas divididas
+
+LIMITES = [
+    {},
+    {'max_duracion_take': 15, 'max_lineas_take': 6, 'max_lineas_consecutivas': 3, 'max_lineas_por_personaje': 3},
+    {'max_duracion_take': 20, 'max_lineas_take': 8, 'max_lineas_consecutivas': 5, 'max_lineas_por_personaje': 2},
+    {'max_duracion_take': 8, 'max_lineas_take': 12, 'max_lineas_consecutivas': 2, 'max_lineas_por_personaje': 5},
+]
+
+def escena_aleatoria(aleatorio, lineas, reparto, solapamiento):
+    # Intervenciones con tiempos solapados, bloques de varios personajes con el mismo IN/OUT
+    # y algunos IN repetidos con distinto OUT
+    filas = []
+    frame = aleatorio.randint(0, 24 * 3600)
+    for _ in range(lineas):
+        if aleatorio.random() > 0.3:
+            frame += aleatorio.randint(0, 24 * 6)
+        fin = frame + aleatorio.randint(6, 24 * 10)
+        personajes = [aleatorio.randrange(reparto)]
+        if aleatorio.random() < solapamiento:
+            personajes += [aleatorio.randrange(reparto) for _ in range(aleatorio.randint(1, 3))]
+        for personaje in personajes:
+            filas.append({'IN': formatear_timecode(frame), 'OUT': formatear_timecode(fin),
+                          'PERSONAJE': f"P{personaje}", 'DIÁLOGO': f"línea {len(filas)}", 'SCENE': 1})
+    df = pd.DataFrame(filas)
+    # Columnas que usaba la versión original y las que usa la actual
+    df['in_td'] = df['IN'].map(referencia.time_to_timedelta)
+    df['out_td'] = df['OUT'].map(referencia.time_to_timedelta)
+    df['duracion'] = (df['out_td'] - df['in_td']).dt.total_seconds()
+    df['in_frames'] = Takeo.timecodes_a_frames(df['IN'])
+    df['out_frames'] = Takeo.timecodes_a_frames(df['OUT'])
+    return df
+
+@pytest.mark.parametrize('limites', LIMITES)
+@pytest.mark.parametrize('semilla', range(15))
+def test_optimizar_takes_escena_igual_que_el_original(semilla, limites):
+    aleatorio = random.Random(semilla)
+    df = escena_aleatoria(aleatorio, aleatorio.randint(1, 70), aleatorio.choice([2, 4, 8]), aleatorio.choice([0.0, 0.2, 0.5]))
+
+    esperado = [[linea['idx'] for linea in take['lineas']] for take in referencia.optimizar_takes_escena(df, **limites)]
+    escena = Takeo.EscenaCompacta(df)
+    takes = Takeo.optimizar_takes_escena(escena, motor='exacto', **limites)
+    assert [escena.filas[inicio:fin].tolist() for inicio, fin in takes] == esperado
+
+def dialogo_aleatorio(aleatorio):
+    # Palabras, acotaciones entre paréntesis (también sin cerrar o sin abrir) y espacios variados
+    piezas = ['hola', 'patrulla', 'x', 'supercalifragilisticoespialidoso', '(off)', '(batera ad lib)',
+              '(risas', 'sin)', '()', '(en voz baja) vamos', 'ya!', '¿qué?', 'ñandú', '—']
+    separadores = [' ', ' ', ' ', '  ', '\t', ' \n']
+    texto = ''
+    for _ in range(aleatorio.randint(0, 40)):
+        texto += aleatorio.choice(piezas) + aleatorio.choice(separadores)
+    return texto if aleatorio.random() < 0.5 else texto.strip()
+
+@pytest.mark.parametrize('semilla', range(20))
+def test_dividir_dialogo_igual_que_el_original(semilla):
+    aleatorio = random.Random(semilla)
+    for _ in range(200):
+        dialogo = dialogo_aleatorio(aleatorio)
+        max_caracteres = aleatorio.choice([5, 20, 40, 60])
+        assert Takeo.dividir_dialogo(dialogo, max_caracteres) == referencia.dividir_dialogo(dialogo, max_caracteres), (dialogo, max_caracteres)
@@ -0,0 +1,25 @@
+import importlib.util
+
+import pandas as pd
+import pytest
+
+import Takeo
+
+@pytest.fixture
+def sin_pyarrow(monkeypatch):
+    # Como en el ejecutable de Takeo.spec, que no incluye pyarrow
+    buscar = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, 'find_spec', lambda nombre, *args: None if nombre == 'pyarrow' else buscar(nombre, *args))
+
+@pytest.mark.parametrize('extension', ['.parquet', '.feather'])
+def test_sin_pyarrow_se_explica_el_error(sin_pyarrow, tmp_path, extension):
+    ruta = str(tmp_path / f"guion{extension}")
+    with pytest.raises(ImportError, match='pyarrow'):
+        Takeo.leer_tabla(ruta)
+    with pytest.raises(ImportError, match='pyarrow'):
+        Takeo.escribir_tabla(pd.DataFrame({'TAKE': [1]}), ruta)
+
+def test_sin_pyarrow_csv_sigue_funcionando(sin_pyarrow, tmp_path):
+    ruta = str(tmp_path / 'takes.csv')
+    Takeo.escribir_tabla(pd.DataFrame({'TAKE': [1], 'PERSONAJE': ['RYDER']}), ruta)
+    assert Takeo.leer_tabla(ruta)['PERSONAJE'].tolist() == ['RYDER']
@@ -0,0 +1,37 @@
+import os
+
+import pandas as pd
+import pytest
+
+import Takeo
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUION = os.path.join(RAIZ, 'PAW PATROL_S2_20.xlsx')
+TAKEO_ESPERADO = os.path.join(RAIZ, 'PAW PATROL_S2_20_TAKEO.xlsx')
+DIALOGO_ESPERADO = os.path.join(RAIZ, 'PAW PATROL_S2_20_DIALOG.txt')
+
+# Salidas del episodio de ejemplo, con el Excel escrito por to_excel y en modo streaming
+@pytest.fixture(scope='module', params=[False, True], ids=['to_excel', 'streaming'])
+def episodio(request, tmp_path_factory):
+    directorio = tmp_path_factory.mktemp('salida')
+    return Takeo.procesar_episodio(GUION, output_dir=str(directorio), excel_streaming=request.param)
+
+def test_txt_identico_al_de_referencia(episodio):
+    with open(episodio['txt'], 'rb') as generado, open(DIALOGO_ESPERADO, 'rb') as esperado:
+        assert generado.read() == esperado.read()
+
+def test_excel_con_los_mismos_valores(episodio):
+    generado = pd.read_excel(episodio['excel'], sheet_name=None, header=None)
+    esperado = pd.read_excel(TAKEO_ESPERADO, sheet_name=None, header=None)
+    assert list(generado) == list(esperado)
+    for hoja in esperado:
+        assert generado[hoja].shape == esperado[hoja].shape, hoja
+        if hoja == 'Optimizada_Takes':
+            # La duración se calcula ahora desde frames enteros; la original venía de un
+            # timedelta redondeado a microsegundos
+            duracion = 5
+            pd.testing.assert_series_equal(generado[hoja].iloc[1:, duracion].astype(float),
+                                           esperado[hoja].iloc[1:, duracion].astype(float), rtol=0, atol=1e-6)
+            generado[hoja] = generado[hoja].drop(columns=duracion)
+            esperado[hoja] = esperado[hoja].drop(columns=duracion)
+        pd.testing.assert_frame_equal(generado[hoja], esperado[hoja], obj=hoja)
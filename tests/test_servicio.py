@@ -0,0 +1,41 @@
+import os
+import time
+
+import pytest
+
+import takeo_servicio
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUION = os.path.join(RAIZ, 'PAW PATROL_S2_20.xlsx')
+
+@pytest.fixture(scope='module')
+def servicio():
+    return takeo_servicio.ServicioTakeo(max_concurrentes=1)
+
+# Peticiones mal formadas: se rechazan al enviarlas (400 por HTTP) en lugar de fallar en el trabajo
+@pytest.mark.parametrize('cambios', [
+    {'fps': '99'},
+    {'formato': 'docx'},
+    {'personajes': 'RYDER'},
+    {'excluir': ['RYDER', 3]},
+    {'max_caracteres': None},
+    {'max_caracteres': 0},
+    {'limites': {'max_lineas_take': 'x'}},
+    {'limites': {'max_duracion_take': True}},
+    {'limites': {'motor': 'rapido'}},
+    {'limites': {'no_existe': 1}},
+])
+def test_peticion_invalida(servicio, cambios):
+    with pytest.raises(ValueError):
+        servicio.enviar({'archivo': GUION, **cambios})
+
+def test_crea_el_directorio_de_salida(servicio, tmp_path):
+    salida = tmp_path / 'no' / 'existe'
+    trabajo = servicio.enviar({'archivo': GUION, 'output_dir': str(salida), 'fps': 24, 'personajes': ['RYDER'],
+                               'limites': {'limite_segundos': None}})
+    fin = time.time() + 60
+    while servicio.consultar(trabajo['id'])['estado'] not in takeo_servicio.ESTADOS_FINALES and time.time() < fin:
+        time.sleep(0.05)
+    trabajo = servicio.consultar(trabajo['id'])
+    assert trabajo['estado'] == 'terminado', trabajo['error']
+    assert os.path.exists(trabajo['resultado']['txt'])
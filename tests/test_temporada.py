@@ -0,0 +1,32 @@
+import os
+
+import pandas as pd
+
+import Takeo
+
+def escribir_takeo(ruta, filas):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    Takeo.escribir_tabla(pd.DataFrame(filas, columns=['TAKE', 'PERSONAJE']), str(ruta))
+
+def test_episodios_con_el_mismo_nombre_no_se_mezclan(tmp_path):
+    # El mismo episodio exportado en dos formatos y dos carpetas hermanas con el mismo nombre
+    archivos = {
+        tmp_path / 'EP1_TAKEO.csv': [(1, 'RYDER'), (2, 'RYDER')],
+        tmp_path / 'EP1_TAKEO.xlsx': [(1, 'RYDER')],
+        tmp_path / 'ShowA' / 'S2' / 'EP2_TAKEO.csv': [(1, 'SKYE'), (2, 'CHASE')],
+        tmp_path / 'ShowB' / 'S2' / 'EP2_TAKEO.csv': [(1, 'SKYE')],
+    }
+    for ruta, filas in archivos.items():
+        escribir_takeo(ruta, filas)
+
+    informe, episodios = Takeo.informe_temporada([str(ruta) for ruta in archivos])
+
+    assert episodios['EPISODIO'].is_unique
+    assert sorted(episodios['EPISODIO']) == sorted(['EP1.csv', 'EP1.xlsx', os.path.join('ShowA', 'S2', 'EP2'),
+                                                    os.path.join('ShowB', 'S2', 'EP2')])
+    totales = informe.set_index('PERSONAJE')['TOTAL_TAKES']
+    assert totales.to_dict() == {'CHASE': 1, 'RYDER': 3, 'SKYE': 2, 'Suma total de Takes:': 6}
+
+def test_nombres_repetidos_en_la_misma_ruta_relativa_llevan_contador():
+    nombres = Takeo.nombres_episodios(['/a/EP1_TAKEO.csv', '/a/EP1_takeo.CSV'])
+    assert sorted(nombres.values()) == ['EP1.csv', 'EP1.csv (2)']